@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Usage
+=====
+
+   bench_parse_bin [--runs=N] [--memory] [--query] [--generate=FILE] [FILES]...
+
+Time ``pyfbx.parse_bin.parse`` for each FBX argument given,
+reporting the best of N runs (3 by default) for each parse mode.
+
+``--memory`` reports the memory held by the parsed result instead
+(as traced by ``tracemalloc``), with and without string interning.
+
+``--query`` times element & property lookups (as done by an importer)
+with ``pyfbx.query`` against a linear search of the nested elements.
+
+``--generate=FILE`` writes a synthetic, properties-heavy FBX file
+(many ``Properties70`` blocks of ``P`` records) to benchmark with.
+"""
+
+import time
+
+
+# ----------------------------------------------------------------------------
+# Synthetic Data
+
+def generate_props_heavy(fn, objects=2000, props=100):
+    from struct import pack
+
+    def prop_string(value):
+        return b'S' + pack(b'<I', len(value)) + value
+
+    def elem(elem_id, props, offset, children=()):
+        # children are functions taking their offset, returning their data
+        data_props = b''.join(props)
+        offset_sub = offset + 13 + len(elem_id) + len(data_props)
+        data_sub = []
+        for child in children:
+            data = child(offset_sub)
+            data_sub.append(data)
+            offset_sub += len(data)
+        if children:
+            data_sub.append(b'\0' * 13)
+            offset_sub += 13
+        return (pack(b'<3IB', offset_sub, len(props), len(data_props), len(elem_id)) +
+                elem_id + data_props + b''.join(data_sub))
+
+    def prop_elem(i):
+        return lambda offset: elem(b'P', (
+            prop_string(b'Prop%d' % i), prop_string(b'double'), prop_string(b'Number'), prop_string(b''),
+            b'D' + pack(b'<d', i * 0.5)), offset)
+
+    def object_elem(i):
+        return lambda offset: elem(b'Model', (
+            b'L' + pack(b'<q', i), prop_string(b'Model%d\x00\x01Model' % i), prop_string(b'Null')), offset, (
+            lambda offset: elem(b'Version', (b'I' + pack(b'<i', 232),), offset),
+            lambda offset: elem(b'Properties70', (), offset, [prop_elem(j) for j in range(props)]),
+            ))
+
+    head = b'Kaydara FBX Binary\x20\x20\x00\x1a\x00' + pack(b'<I', 7300)
+    with open(fn, 'wb') as f:
+        f.write(head)
+        f.write(elem(b'Objects', (), len(head), [object_elem(i) for i in range(objects)]))
+        f.write(b'\0' * 13)
+
+
+# ----------------------------------------------------------------------------
+# Benchmark
+
+def bench(fn, runs):
+    from pyfbx import parse_bin
+
+    modes = (
+        ("default", {}),
+        ("use_mmap", {"use_mmap": True}),
+        ("lazy_arrays", {"lazy_arrays": True}),
+        ("use_mmap, lazy_arrays", {"use_mmap": True, "lazy_arrays": True}),
+        )
+
+    print("%s:" % fn)
+    for mode_name, mode_kw in modes:
+        t_best = None
+        for i in range(runs):
+            t = time.perf_counter()
+            parse_bin.parse(fn, **mode_kw)
+            t = time.perf_counter() - t
+            if t_best is None or t < t_best:
+                t_best = t
+        print("    %-24s %.4f sec" % (mode_name, t_best))
+
+
+def bench_memory(fn):
+    import gc
+    import tracemalloc
+    from pyfbx import parse_bin, store_bin
+
+    modes = (
+        ("intern_strings=False", lambda: parse_bin.parse(fn, intern_strings=False)),
+        ("intern_strings=True", lambda: parse_bin.parse(fn, intern_strings=True)),
+        ("store_bin", lambda: store_bin.parse(fn)),
+        )
+
+    print("%s:" % fn)
+    for mode_name, mode_parse in modes:
+        gc.collect()
+        tracemalloc.start()
+        result = mode_parse()
+        gc.collect()
+        size, size_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+        print("    %-24s %10.2f MB (peak %.2f MB)" % (mode_name, size / 1e6, size_peak / 1e6))
+
+
+# linear search, as blender_test.py did before using pyfbx.query
+def elem_find_first(elem, id_search):
+    for fbx_item in elem.elems:
+        if fbx_item.id == id_search:
+            return fbx_item
+
+
+def elem_props_find_first(elem, elem_prop_id):
+    for subelem in elem.elems:
+        assert(subelem.id == b'P')
+        if subelem.props[0] == elem_prop_id:
+            return subelem
+    return None
+
+
+def bench_query(fn, runs):
+    from pyfbx import parse_bin, query
+
+    elem_root, fbx_version = parse_bin.parse(fn)
+
+    # the lookups of each object, its nested elements and properties
+    lookups = []
+    for fbx_obj in elem_find_first(elem_root, b'Objects').elems:
+        elem_ids = [elem.id for elem in fbx_obj.elems]
+        fbx_props = elem_find_first(fbx_obj, b'Properties70')
+        prop_ids = [elem.props[0] for elem in fbx_props.elems] if fbx_props is not None else []
+        lookups.append((fbx_obj, elem_ids, prop_ids))
+
+    def lookup_all(find_first, props_find_first):
+        for fbx_obj, elem_ids, prop_ids in lookups:
+            for elem_id in elem_ids:
+                find_first(fbx_obj, elem_id)
+            if prop_ids:
+                fbx_props = find_first(fbx_obj, b'Properties70')
+                for prop_id in prop_ids:
+                    props_find_first(fbx_props, prop_id)
+
+    def lookup_linear():
+        lookup_all(elem_find_first, elem_props_find_first)
+
+    def lookup_query():
+        # includes building the indices
+        fbx_query = query.FBXQuery(elem_root)
+        lookup_all(fbx_query.find_first, fbx_query.props_find_first)
+
+    modes = (
+        ("linear", lookup_linear),
+        ("query", lookup_query),
+        )
+
+    print("%s: %d objects, %d lookups" % (
+        fn, len(lookups), sum(len(elem_ids) + len(prop_ids) for fbx_obj, elem_ids, prop_ids in lookups)))
+    for mode_name, mode_lookup in modes:
+        t_best = None
+        for i in range(runs):
+            t = time.perf_counter()
+            mode_lookup()
+            t = time.perf_counter() - t
+            if t_best is None or t < t_best:
+                t_best = t
+        print("    %-24s %.4f sec" % (mode_name, t_best))
+
+
+# ----------------------------------------------------------------------------
+# Command Line
+
+def main():
+    import sys
+
+    if "--help" in sys.argv:
+        print(__doc__)
+        return
+
+    runs = 3
+    use_memory = False
+    use_query = False
+    files = []
+    for arg in sys.argv[1:]:
+        if arg.startswith("--runs="):
+            runs = int(arg[7:])
+        elif arg == "--memory":
+            use_memory = True
+        elif arg == "--query":
+            use_query = True
+        elif arg.startswith("--generate="):
+            fn = arg[11:]
+            print("Writing: %r" % fn)
+            generate_props_heavy(fn)
+            files.append(fn)
+        else:
+            files.append(arg)
+
+    for fn in files:
+        if use_memory:
+            bench_memory(fn)
+        elif use_query:
+            bench_query(fn, runs)
+        else:
+            bench(fn, runs)
+
+
+if __name__ == "__main__":
+    main()
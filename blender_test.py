@@ -36,7 +36,7 @@ try:
 except:
     bpy = None
 print("starting: %s" % ("in blender" if bpy else "alone"))
-from pyfbx import parse_bin, data_types
+from pyfbx import parse_bin, data_types, query, scene, geom
 
 # /src/blender/blender.bin --background --env-system-scripts /src/blender/release/scripts --enable-autoexec --python /src/pyfbx_i42/blender_test.py
 
@@ -44,10 +44,12 @@ from pyfbx import parse_bin, data_types
 # -----
 # Utils
 
+# indexed lookups in the file being loaded, set by main()
+fbx_query = None
+
+
 def elem_find_first(elem, id_search):
-    for fbx_item in elem.elems:
-        if fbx_item.id == id_search:
-            return fbx_item
+    return fbx_query.find_first(elem, id_search)
 
 def elem_find_first_string(elem, id_search):
     fbx_item = elem_find_first(elem, id_search)
@@ -98,11 +100,7 @@ def elem_prop_first(elem):
 # Support for
 # Properties70: { ... P:
 def elem_props_find_first(elem, elem_prop_id):
-    for subelem in elem.elems:
-        assert(subelem.id == b'P')
-        if subelem.props[0] == elem_prop_id:
-            return subelem
-    return None
+    return fbx_query.props_find_first(elem, elem_prop_id)
 
 def elem_props_get_color_rgb(elem, elem_prop_id, default=None):
     elem_prop = elem_props_find_first(elem, elem_prop_id)
@@ -149,12 +147,10 @@ def blen_read_geom_layerinfo(fbx_layer):
         )
 
 
-def blen_read_geom_uv(fbx_obj, me):
+def blen_read_geom_uv(fbx_geom, me):
 
-    for uvlayer_id in (b'LayerElementUV',):
-        fbx_uvlayer = elem_find_first(fbx_obj, uvlayer_id)
-        
-        if fbx_uvlayer is None:
+    for fbx_uvlayer, uv_values in fbx_geom.layers:
+        if fbx_uvlayer.id != b'LayerElementUV':
             continue
 
         # all should be valid
@@ -165,67 +161,43 @@ def blen_read_geom_uv(fbx_obj, me):
 
         # print(fbx_uvlayer_name, fbx_uvlayer_mapping, fbx_uvlayer_ref)
 
-        fbx_layer_data = elem_prop_first(elem_find_first(fbx_uvlayer, b'UV'))
-        fbx_layer_index = elem_prop_first(elem_find_first(fbx_uvlayer, b'UVIndex'))
-
-        # TODO, generic mappuing apply function
-        if fbx_uvlayer_mapping == b'ByPolygonVertex':
-            if fbx_uvlayer_ref == b'IndexToDirect':
-                # TODO, more generic support for mapping types
-                uv_tex = me.uv_textures.new(name=fbx_uvlayer_name)
-                uv_lay = me.uv_layers[fbx_uvlayer_name]
-                uv_data = [luv.uv for luv in uv_lay.data]
-
-                for i, j in enumerate(fbx_layer_index):
-                    uv_data[i][:] = fbx_layer_data[(j * 2) : (j * 2) + 2]
-            else:
-                print("warning uv layer ref type unsupported:", fbx_uvlayer_ref)
-        else:
-            print("warning uv layer mapping type unsupported:", fbx_uvlayer_mapping)
+        uv_tex = me.uv_textures.new(name=fbx_uvlayer_name)
+        uv_lay = me.uv_layers[fbx_uvlayer_name]
+        # a UV for each loop, whatever the mapping & reference types
+        uv_lay.data.foreach_set("uv", uv_values)
+        break
 
-        # print("AAA", fbx_uvlayer)
-        # print("AAA", fbx_layer_data)
+    for fbx_uvlayer, message in fbx_geom.layers_unsupported:
+        print("warning uv layer unsupported:", message)
 
 
-def blen_read_geom(fbx_obj):
+def blen_read_geom(fbx_geom):
+    """
+    Create a mesh from ``fbx_geom``, decoded by ``geom.geometry_decode``.
+    """
+    fbx_obj = fbx_geom.elem
     elem_name, elem_class = elem_split_name_class(fbx_obj)
     assert(elem_class == b'Geometry')
     elem_name_utf8 = elem_name.decode('utf-8')
 
-    fbx_verts = elem_prop_first(elem_find_first(fbx_obj, b'Vertices'))
-    fbx_polys = elem_prop_first(elem_find_first(fbx_obj, b'PolygonVertexIndex'))
     # TODO
     # fbx_edges = elem_prop_first(elem_find_first(fbx_obj, b'Edges'))
 
     # print(fbx_obj.props)
-    # print(fbx_verts)
-    # print(fbx_polys)
     me = bpy.data.meshes.new(name=elem_name_utf8)
-    me.vertices.add(len(fbx_verts) // 3)
-    me.vertices.foreach_set("co", fbx_verts)
-
-    me.loops.add(len(fbx_polys))
-
-    #poly_loops = []  # pairs (loop_start, loop_total)
-    poly_loop_starts = []
-    poly_loop_totals = []
-    poly_loop_prev = 0
-    for i, l in enumerate(me.loops):
-        index = fbx_polys[i]
-        if index < 0:
-            poly_loop_starts.append(poly_loop_prev)
-            poly_loop_totals.append((i - poly_loop_prev) + 1)
-            poly_loop_prev = i + 1
-            index = -(index + 1)
-        l.vertex_index = index
-    poly_loop_starts.append(poly_loop_prev)
-    poly_loop_totals.append((i - poly_loop_prev) + 1)
+    me.vertices.add(len(fbx_geom.vertices) // 3)
+    me.vertices.foreach_set("co", fbx_geom.vertices)
+
+    loop_vertex_indices, poly_loop_starts, poly_loop_totals = fbx_geom.polys
+
+    me.loops.add(len(loop_vertex_indices))
+    me.loops.foreach_set("vertex_index", loop_vertex_indices)
 
     me.polygons.add(len(poly_loop_starts))
     me.polygons.foreach_set("loop_start", poly_loop_starts)
     me.polygons.foreach_set("loop_total", poly_loop_totals)
 
-    blen_read_geom_uv(fbx_obj, me)
+    blen_read_geom_uv(fbx_geom, me)
 
     me.validate(0)
     me.use_fake_user = True
@@ -320,7 +292,11 @@ def blen_read_texture(fbx_obj, basedir, texture_cache):
 
 
 def main():
-    elem_root, version = parse_bin.parse(fn)
+    global fbx_query
+
+    # arrays are inflated when the geometry is decoded (on worker threads)
+    elem_root, version = parse_bin.parse(fn, lazy_arrays=True)
+    fbx_query = query.FBXQuery(elem_root)
     basedir = os.path.dirname(fn)
     texture_cache = {}
 
@@ -332,53 +308,38 @@ def main():
     if fbx_connections is None:
         return print("no 'Connections' found")
 
-    for fbx_obj in fbx_objects.elems:
-        assert(fbx_obj.props_type == b'LSS')
-        fbx_uuid = elem_uuid(fbx_obj)
-        fbx_table_object[fbx_uuid] = [fbx_obj, None]
-    del fbx_obj
-
     # ----
     # First load in the data
     # http://download.autodesk.com/us/fbx/20112/FBX_SDK_HELP/index.html?url=WS73099cc142f487551fea285e1221e4f9ff8-7fda.htm,topicNumber=d0e6388
 
-    fbx_connection_map = {}
-    fbx_connection_map_reverse = {}
+    # objects by uuid & the connections between them, by object type
+    fbx_scene = scene.FBXScene(elem_root, fbx_query)
 
-    for fbx_link in fbx_connections.elems:
-        # print(fbx_link)
-        c_type = fbx_link.props[0]
-        c_src, c_dst = fbx_link.props[1:3]
-        # if c_type == b'OO':
-        
-        fbx_connection_map.setdefault(c_src, []).append((c_dst, fbx_link))
-        fbx_connection_map_reverse.setdefault(c_dst, []).append((c_src, fbx_link))
-        a = repr((c_type,
-            getattr(fbx_table_object.get(c_src, (None,))[0], "id", None), "->",
-            getattr(fbx_table_object.get(c_dst, (None,))[0], "id", None)))
-        
-        if "Texture" in a and "Video" in a:
-            pass
-        elif "Texture" in a or "Video" in a:
-            print(a)
-        else:
-            pass
-            
+    for fbx_uuid, fbx_obj in fbx_scene.objects.items():
+        assert(fbx_obj.props_type == b'LSS')
+        fbx_table_object[fbx_uuid] = [fbx_obj, None]
+    del fbx_obj
 
 
     # ----
     # Load model data (currently mesh objects)
     # TODO
 
+    # ----
+    # Decode mesh data, all geometry at once (in parallel)
+    fbx_geom_items = [fbx_item for fbx_item in fbx_table_object.values()
+                      if fbx_item[0].id == b'Geometry' and fbx_item[0].props[-1] == b'Mesh']
+    fbx_geoms = geom.geometry_decode_all(
+        [fbx_item[0] for fbx_item in fbx_geom_items],
+        executor=os.cpu_count() or 1,
+        layer_types={b'LayerElementUV'},
+        )
+
     # ----
     # Load mesh data
-    for fbx_uuid, fbx_item in fbx_table_object.items():
-        fbx_obj, blen_data = fbx_item
-        if fbx_obj.id == b'Geometry':
-            # print(fbx_obj)
-            if fbx_obj.props[-1] == b'Mesh':
-                assert(blen_data is None)
-                fbx_item[1] = blen_read_geom(fbx_obj)
+    for fbx_item, fbx_geom in zip(fbx_geom_items, fbx_geoms):
+        assert(fbx_item[1] is None)
+        fbx_item[1] = blen_read_geom(fbx_geom)
 
     # ----
     # Load material data
@@ -406,17 +367,13 @@ def main():
     # ----
     # Connections
 
-    def connection_filter_ex(fbx_uuid, fbx_id, dct):
-        return [(c_found[0], c_found[1], c_type)
-                for (c_uuid, c_type) in dct.get(fbx_uuid, ())
-                for c_found in (fbx_table_object[c_uuid],)
-                if c_found[0].id == fbx_id]
-
     def connection_filter_forward(fbx_uuid, fbx_id):
-        return connection_filter_ex(fbx_uuid, fbx_id, fbx_connection_map)
+        return [(c_obj, fbx_table_object[c.dst][1], c.elem)
+                for c_obj, c in fbx_scene.forward(fbx_uuid, fbx_id)]
 
     def connection_filter_reverse(fbx_uuid, fbx_id):
-        return connection_filter_ex(fbx_uuid, fbx_id, fbx_connection_map_reverse)
+        return [(c_obj, fbx_table_object[c.src][1], c.elem)
+                for c_obj, c in fbx_scene.reverse(fbx_uuid, fbx_id)]
 
     # link Material's to Geometry (via Model's)
     for fbx_uuid, fbx_item in fbx_table_object.items():
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Usage
+=====
+
+   fbx2col [FILES]...
+
+This script will write a ``.fbxcol`` file for each FBX argument given,
+a binary alternative to ``fbx2json`` where arrays aren't converted to text.
+
+
+Output
+======
+
+The file starts with a 24 byte header::
+
+   b'FBXCOL\\x00\\x01', manifest offset (uint64), manifest length (uint64)
+
+Followed by the array data and the manifest, all little-endian.
+
+The manifest is UTF-8 JSON, formatted as ``fbx2json`` output:
+
+   ``[id, [data, ...], "data_types", [subtree, ...]]``
+
+Except that array properties are stored as references to their data:
+
+   ``{"array": "<f8", "offset": 4096, "count": 300}``
+
+Where ``array`` is the NumPy style type (``<f4``, ``<i4``, ``<f8`` or ``<i8``),
+``offset`` is the (64 byte aligned) position of the data in the file
+and ``count`` is the number of items.
+
+The manifest is a list of top-level elements with the FBX version:
+
+   ``{"fbx_version": 7400, "elems": [...]}``
+
+``fbx2col_load`` reads the file back, the arrays being views of a memory-map of the file.
+"""
+
+import json
+from struct import Struct
+
+from pyfbx import parse_bin, write_bin, data_types
+
+_COL_MAGIC = b'FBXCOL\x00\x01'
+_COL_ALIGN = 64
+
+_struct_col_head = Struct(b'<8sQQ')
+
+# type code: (NumPy style type, memoryview format)
+_array_types = {
+    b'f'[0]: ('<f4', 'f'),
+    b'i'[0]: ('<i4', 'i'),
+    b'd'[0]: ('<f8', 'd'),
+    b'l'[0]: ('<i8', 'q'),
+    }
+
+
+# ----------------------------------------------------------------------------
+# Columnar Converter
+
+def fbx2col_property(prop, prop_type):
+    # see: fbx2json.fbx2json_property_as_string
+    if prop_type == data_types.STRING:
+        return bytes(prop).decode('utf-8', 'replace').replace('\x00\x01', '::')
+    elif prop_type == data_types.BYTES or prop_type == b'b'[0]:
+        # 'b' (unknown) is raw data too
+        return repr(bytes(prop))[2:-1]
+    return prop
+
+
+def fbx2col(fn):
+    import os
+
+    fn_col = "%s.fbxcol" % os.path.splitext(fn)[0]
+    print("Writing: %r " % fn_col, end="")
+    fbx_events, fbx_version = parse_bin.parse_events(fn)
+    print("(Version %d) ..." % fbx_version)
+
+    # the manifest being built, (id, props, types, subtree) of the elements on the current path
+    elems_root = []
+    stack = [elems_root]
+
+    with open(fn_col, 'wb') as f:
+        fw = f.write
+        fw(_struct_col_head.pack(_COL_MAGIC, 0, 0))
+        offset = _struct_col_head.size
+
+        for event, elem_id, elem_props, elem_props_type, depth, elem_offset in fbx_events:
+            if event == "end":
+                stack.pop()
+                continue
+
+            props = []
+            for prop, prop_type in zip(elem_props, elem_props_type):
+                array_info = _array_types.get(prop_type)
+                if array_info is None:
+                    props.append(fbx2col_property(prop, prop_type))
+                    continue
+
+                array_type, array_stride, array_byteswap = write_bin._array_type_dict[prop_type]
+                data = write_bin.array_as_bytes(prop, array_type, array_stride, array_byteswap)
+
+                pad = -offset % _COL_ALIGN
+                fw(b'\0' * pad)
+                offset += pad
+                props.append({"array": array_info[0], "offset": offset, "count": len(data) // array_stride})
+                fw(data)
+                offset += len(data)
+
+            elems = []
+            stack[-1].append([elem_id.decode('utf-8', 'replace'), props, elem_props_type.decode('ascii'), elems])
+            stack.append(elems)
+
+        manifest = json.dumps({"fbx_version": fbx_version, "elems": elems_root},
+                              ensure_ascii=True, separators=(',', ':')).encode('utf-8')
+        fw(manifest)
+
+        f.seek(0)
+        fw(_struct_col_head.pack(_COL_MAGIC, offset, len(manifest)))
+
+
+def fbx2col_load(fn, use_numpy=False):
+    """
+    Load a ``.fbxcol`` file, returning the top-level elements and the FBX version.
+    Arrays are memoryviews (or NumPy arrays when ``use_numpy`` is enabled)
+    of a memory-map of the file.
+    """
+    import mmap
+    import sys
+
+    with open(fn, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, manifest_offset, manifest_length = _struct_col_head.unpack_from(data, 0)
+    if magic != _COL_MAGIC:
+        raise IOError("Invalid header")
+    manifest = json.loads(data[manifest_offset:manifest_offset + manifest_length].decode('utf-8'))
+
+    if use_numpy:
+        import numpy as np
+
+        def array_load(array_ref):
+            return np.frombuffer(data, array_ref["array"], array_ref["count"], array_ref["offset"])
+    else:
+        if sys.byteorder != 'little':
+            raise IOError("memoryview arrays need a little-endian system, use NumPy instead")
+        data_view = memoryview(data)
+        array_formats = {array_type: array_format for array_type, array_format in _array_types.values()}
+
+        def array_load(array_ref):
+            array_format = array_formats[array_ref["array"]]
+            array_offset = array_ref["offset"]
+            array_size = array_ref["count"] * int(array_ref["array"][2])
+            return data_view[array_offset:array_offset + array_size].cast(array_format)
+
+    stack = [manifest["elems"]]
+    while stack:
+        for elem in stack.pop():
+            props = elem[1]
+            for i, prop in enumerate(props):
+                if type(prop) is dict:
+                    props[i] = array_load(prop)
+            stack.append(elem[3])
+
+    return manifest["elems"], manifest["fbx_version"]
+
+
+# ----------------------------------------------------------------------------
+# Command Line
+
+def main():
+    import sys
+
+    if "--help" in sys.argv:
+        print(__doc__)
+        return 0
+
+    failed = 0
+    for arg in sys.argv[1:]:
+        try:
+            fbx2col(arg)
+        except:
+            print("Failed to convert %r, error:" % arg)
+
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -26,10 +26,20 @@
 Usage
 =====
 
-   fbx2json [FILES]...
+   fbx2json [--jobs=N] [--float-precision=N] [--stats] [FILES]...
 
 This script will write a JSON file for each FBX argument given.
 
+``--jobs=N`` converts the files in N processes,
+writing a summary of the time taken and sizes for each file at the end.
+The exit code is non-zero when any file fails to convert.
+
+``--float-precision=N`` writes array floats with N significant digits (``%.Ng``),
+which is faster than the default, exact ``repr`` output.
+
+``--stats`` prints statistics for each file, the number of elements & properties,
+compressed array sizes and the time spent on each part of the conversion.
+
 
 Output
 ======
@@ -68,15 +78,19 @@ ensured to be unique.
 # ----------------------------------------------------------------------------
 # FBX Binary Parser
 
-from struct import unpack
+from struct import unpack, Struct
 import array
 import zlib
 
 # at the end of each nested block, there is a NUL record to indicate
 # that the sub-scope exists (i.e. to distinguish between P: and P : {})
-# this NUL record is 13 bytes long.
-_BLOCK_SENTINEL_LENGTH = 13
-_BLOCK_SENTINEL_DATA = (b'\0' * _BLOCK_SENTINEL_LENGTH)
+# this NUL record is the size of an element header (see: elem_head_struct).
+
+# end_offset, prop_count, prop_length, elem_id size
+_struct_elem_head = Struct(b'<3IB')
+# FBX 7500 and later use 64-bit element header fields, for files over 4 GiB
+_struct_elem_head_64 = Struct(b'<3QB')
+_ELEM_HEAD_64_VERSION = 7500
 _IS_BIG_ENDIAN = (__import__("sys").byteorder != 'little')
 from collections import namedtuple
 FBXElem = namedtuple("FBXElem", ("id", "props", "props_type", "elems"))
@@ -87,17 +101,7 @@ def read_uint(read):
     return unpack(b'<I', read(4))[0]
 
 
-def read_ubyte(read):
-    return unpack(b'B', read(1))[0]
-
-
-def read_string_ubyte(read):
-    size = read_ubyte(read)
-    data = read(size)
-    return data
-
-
-def unpack_array(read, array_type, array_stride, array_byteswap):
+def unpack_array(read, array_type, array_stride, array_byteswap, stats=None):
     length = read_uint(read)
     encoding = read_uint(read)
     comp_len = read_uint(read)
@@ -107,7 +111,15 @@ def unpack_array(read, array_type, array_stride, array_byteswap):
     if encoding == 0:
         pass
     elif encoding == 1:
-        data = zlib.decompress(data)
+        if stats is None:
+            data = zlib.decompress(data)
+        else:
+            t = stats_perf_counter()
+            data = zlib.decompress(data)
+            stats.time_zlib += stats_perf_counter() - t
+            stats.array_count_compressed += 1
+            stats.array_bytes_compressed += comp_len
+            stats.array_bytes_inflated += len(data)
 
     assert(length * array_stride == len(data))
 
@@ -134,18 +146,16 @@ read_data_dict = {
     }
 
 
-def read_elem(read, tell, use_namedtuple):
+def read_elem(read, tell, use_namedtuple, elem_head=_struct_elem_head):
     # [0] the offset at which this block ends
     # [1] the number of properties in the scope
     # [2] the length of the property list
-    end_offset = read_uint(read)
+    # [3] the length of the elem name
+    end_offset, prop_count, prop_length, elem_id_size = elem_head.unpack(read(elem_head.size))
     if end_offset == 0:
         return None
 
-    prop_count = read_uint(read)
-    prop_length = read_uint(read)
-
-    elem_id = read_string_ubyte(read)        # elem name of the scope/key
+    elem_id = read(elem_id_size)             # elem name of the scope/key
     elem_props_type = bytearray(prop_count)  # elem property types
     elem_props_data = [None] * prop_count    # elem properties (if any)
     elem_subtree = []                        # elem children (if any)
@@ -156,10 +166,10 @@ def read_elem(read, tell, use_namedtuple):
         elem_props_type[i] = data_type
 
     if tell() < end_offset:
-        while tell() < (end_offset - _BLOCK_SENTINEL_LENGTH):
-            elem_subtree.append(read_elem(read, tell, use_namedtuple))
+        while tell() < (end_offset - elem_head.size):
+            elem_subtree.append(read_elem(read, tell, use_namedtuple, elem_head))
 
-        if read(_BLOCK_SENTINEL_LENGTH) != _BLOCK_SENTINEL_DATA:
+        if read(elem_head.size) != b'\0' * elem_head.size:
             raise IOError("failed to read nested block sentinel, "
                           "expected all bytes to be 0")
 
@@ -170,6 +180,97 @@ def read_elem(read, tell, use_namedtuple):
     return FBXElem(*args) if use_namedtuple else args
 
 
+def elem_head_struct(fbx_version):
+    """
+    Return the ``Struct`` for element headers in files of ``fbx_version``,
+    FBX 7500 and later use 64-bit element header fields (for files over 4 GiB).
+    """
+    return _struct_elem_head_64 if fbx_version >= _ELEM_HEAD_64_VERSION else _struct_elem_head
+
+
+def read_elem_events(f, read_data=read_data_dict, elem_head=_struct_elem_head):
+    """
+    Generator reading elements from the file ``f`` (positioned after the header),
+    yielding ``(event, id, props, props_type, depth)`` tuples,
+    ``"start"`` once an element's properties have been read,
+    ``"end"`` once its nested elements have been read too.
+    Only the elements on the current path are held in memory.
+    ``elem_head`` depends on the FBX version, see: ``elem_head_struct``.
+    """
+    read = f.read
+    tell = f.tell
+    elem_head_unpack = elem_head.unpack
+    elem_head_size = elem_head.size
+    sentinel_data = b'\0' * elem_head_size
+
+    # end offsets of the elements with a nested list being read
+    stack = []
+
+    with f:
+        while True:
+            if stack and tell() == stack[-1] - elem_head_size:
+                stack.pop()
+                if read(elem_head_size) != sentinel_data:
+                    raise IOError("failed to read nested block sentinel, "
+                                  "expected all bytes to be 0")
+                yield ("end", None, None, None, len(stack))
+                continue
+
+            end_offset, prop_count, prop_length, elem_id_size = elem_head_unpack(read(elem_head_size))
+            if end_offset == 0:
+                if stack:
+                    raise IOError("unexpected NULL record, something is wrong")
+                break
+
+            elem_id = read(elem_id_size)
+            elem_props_type = bytearray(prop_count)
+            elem_props_data = [None] * prop_count
+
+            for i in range(prop_count):
+                data_type = read(1)[0]
+                elem_props_data[i] = read_data[data_type](read, prop_length)
+                elem_props_type[i] = data_type
+
+            yield ("start", elem_id, elem_props_data, elem_props_type, len(stack))
+
+            if tell() < end_offset:
+                stack.append(end_offset)
+            elif tell() != end_offset:
+                raise IOError("scope length not reached, something is wrong")
+            else:
+                yield ("end", None, None, None, len(stack))
+
+
+def parse_events(fn, stats=None):
+    """
+    Incremental alternative to ``parse``, returning an iterator of events
+    (see ``read_elem_events``) and the FBX version.
+
+    ``stats`` is an optional ``FBXParseStats``, filled in as the iterator advances.
+    """
+    f = open(fn, 'rb')
+    try:
+        read = f.read
+
+        HEAD_MAGIC = b'Kaydara FBX Binary\x20\x20\x00\x1a\x00'
+        if read(len(HEAD_MAGIC)) != HEAD_MAGIC:
+            raise IOError("Invalid header")
+
+        fbx_version = read_uint(read)
+        elem_head = elem_head_struct(fbx_version)
+    except:
+        f.close()
+        raise
+
+    if stats is not None:
+        import os
+        stats.file_size += os.fstat(f.fileno()).st_size
+        events = read_elem_events(f, stats_read_data_dict(stats, f.tell), elem_head)
+        return stats_events(events, stats), fbx_version
+
+    return read_elem_events(f, elem_head=elem_head), fbx_version
+
+
 def parse(fn, use_namedtuple=True):
     # import time
     # t = time.time()
@@ -185,9 +286,10 @@ def parse(fn, use_namedtuple=True):
             raise IOError("Invalid header")
 
         fbx_version = read_uint(read)
+        elem_head = elem_head_struct(fbx_version)
 
         while True:
-            elem = read_elem(read, tell, use_namedtuple)
+            elem = read_elem(read, tell, use_namedtuple, elem_head)
             if elem is None:
                 break
             root_elems.append(elem)
@@ -198,6 +300,135 @@ def parse(fn, use_namedtuple=True):
     return FBXElem(*args) if use_namedtuple else args, fbx_version
 
 
+# ----------------------------------------------------------------------------
+# Statistics
+#
+# Only used when requested, so parsing without statistics is unaffected.
+
+from time import perf_counter as stats_perf_counter
+
+
+class FBXParseStats:
+    """
+    Statistics of a parse, see: ``parse(..., stats=FBXParseStats())`` & ``report``.
+
+    - ``file_size``: size of the file (in bytes).
+    - ``elem_count``: number of elements by id.
+    - ``prop_count``, ``prop_bytes``: number of properties by type code,
+      and the bytes they take in the file (excluding the type code).
+    - ``array_count_compressed``, ``array_bytes_compressed``, ``array_bytes_inflated``:
+      number of compressed arrays, their size in the file and once inflated.
+    - ``time_total``: time taken to parse.
+    - ``time_props``: time decoding property lists (including ``time_zlib``),
+      the remainder of ``time_total`` is spent walking the elements.
+    - ``time_zlib``: time inflating arrays (on the thread parsing the file).
+    - ``time_zlib_workers``: time inflating arrays on worker threads (see ``executor``),
+      summed across the threads.
+
+    Times are in seconds, including the overhead of measuring them.
+    """
+    __slots__ = (
+        "file_size",
+        "elem_count",
+        "prop_count",
+        "prop_bytes",
+        "array_count_compressed",
+        "array_bytes_compressed",
+        "array_bytes_inflated",
+        "time_total",
+        "time_props",
+        "time_zlib",
+        "time_zlib_workers",
+        )
+
+    def __init__(self):
+        self.file_size = 0
+        self.elem_count = {}
+        self.prop_count = {}
+        self.prop_bytes = {}
+        self.array_count_compressed = 0
+        self.array_bytes_compressed = 0
+        self.array_bytes_inflated = 0
+        self.time_total = 0.0
+        self.time_props = 0.0
+        self.time_zlib = 0.0
+        self.time_zlib_workers = 0.0
+
+    def report(self, elem_limit=20):
+        """
+        Return the statistics as text, listing the ``elem_limit`` most common element ids.
+        """
+        lines = [
+            "File size: %d bytes" % self.file_size,
+            "Time: %.4f sec (walk %.4f, properties %.4f, zlib %.4f, zlib on workers %.4f)" % (
+                self.time_total,
+                self.time_total - self.time_props,
+                self.time_props - self.time_zlib,
+                self.time_zlib,
+                self.time_zlib_workers,
+                ),
+            "Compressed arrays: %d, %d -> %d bytes" % (
+                self.array_count_compressed, self.array_bytes_compressed, self.array_bytes_inflated),
+            "Properties:",
+            ]
+        for data_type, count in sorted(self.prop_count.items()):
+            lines.append("    %s %12d %16d bytes" % (chr(data_type), count, self.prop_bytes.get(data_type, 0)))
+
+        lines.append("Elements: %d" % sum(self.elem_count.values()))
+        elem_count = sorted(self.elem_count.items(), key=lambda item: (-item[1], item[0]))
+        for elem_id, count in elem_count[:elem_limit]:
+            lines.append("    %-32s %12d" % (elem_id.decode('utf-8', 'replace'), count))
+        if len(elem_count) > elem_limit:
+            lines.append("    (%d more)" % (len(elem_count) - elem_limit))
+        return "\n".join(lines)
+
+
+def stats_read_data_dict(stats, tell):
+    """
+    Return ``read_data_dict``, recording properties in ``stats``.
+    """
+    prop_count = stats.prop_count
+    prop_bytes = stats.prop_bytes
+
+    read_data = dict(read_data_dict)
+    read_data.update({
+        b'f'[0]: lambda read, size: unpack_array(read, 'f', 4, False, stats),  # array (float)
+        b'i'[0]: lambda read, size: unpack_array(read, 'i', 4, True, stats),   # array (int)
+        b'd'[0]: lambda read, size: unpack_array(read, 'd', 8, False, stats),  # array (double)
+        b'l'[0]: lambda read, size: unpack_array(read, 'q', 8, True, stats),   # array (long)
+        })
+
+    def prop_read_stats(data_type, prop_read):
+        def prop_read_wrap(read, size):
+            t = stats_perf_counter()
+            offset = tell()
+            value = prop_read(read, size)
+            prop_count[data_type] = prop_count.get(data_type, 0) + 1
+            prop_bytes[data_type] = prop_bytes.get(data_type, 0) + tell() - offset
+            stats.time_props += stats_perf_counter() - t
+            return value
+        return prop_read_wrap
+
+    return {data_type: prop_read_stats(data_type, prop_read)
+            for data_type, prop_read in read_data.items()}
+
+
+def stats_events(events, stats):
+    """
+    Wrap the iterator ``events``, recording elements and the time taken to read them in ``stats``.
+    """
+    elem_count = stats.elem_count
+    while True:
+        t = stats_perf_counter()
+        event = next(events, None)
+        stats.time_total += stats_perf_counter() - t
+        if event is None:
+            break
+        if event[0] == "start":
+            elem_count[event[1]] = elem_count.get(event[1], 0) + 1
+        yield event
+
+
 # ----------------------------------------------------------------------------
 # Inline Modules
 
@@ -223,7 +454,9 @@ INT64_ARRAY = b'l'[0],
 parse_bin = type(array)("parse_bin")
 parse_bin.__dict__.update(
 dict(
-parse = parse
+parse = parse,
+parse_events = parse_events,
+FBXParseStats = FBXParseStats,
 ))
 
 
@@ -246,52 +479,173 @@ def fbx2json_property_as_string(prop, prop_type):
         elif prop_py_type == bool:
             return json.dumps(prop)
         elif prop_py_type == array.array:
-            return repr(list(prop))
+            return "[%s]" % ", ".join(map(repr, prop))
 
     return repr(prop)
 
 
-def fbx2json_properties_as_string(fbx_elem):
-    return ", ".join(fbx2json_property_as_string(*prop_item)
-                     for prop_item in zip(fbx_elem.props,
-                                          fbx_elem.props_type))
+# number of items formatted at once
+_ARRAY_CHUNK_SIZE = 1 << 16
 
 
-def fbx2json_recurse(fw, fbx_elem, ident, is_last):
-    fbx_elem_id = fbx_elem.id.decode('utf-8')
-    fw('%s["%s", ' % (ident, fbx_elem_id))
-    fw('[%s], ' % fbx2json_properties_as_string(fbx_elem))
-    fw('"%s", ' % (fbx_elem.props_type.decode('ascii')))
+def fbx2json_array_write(fw, prop, float_precision=None):
+    """
+    Write the array ``prop`` in chunks, matching ``repr(list(prop))``
+    (or with ``float_precision`` significant digits for floats),
+    without creating a list or string for the whole array.
+    """
+    size = len(prop)
+    chunk_size = _ARRAY_CHUNK_SIZE
+
+    if float_precision is not None and prop.typecode in {'f', 'd'}:
+        # a single format operation per chunk
+        fmt_item = "%%.%dg" % float_precision
+        fmt_chunk = ", ".join((fmt_item,) * chunk_size)
+
+        def format_chunk(chunk):
+            if len(chunk) == chunk_size:
+                return fmt_chunk % tuple(chunk)
+            return ", ".join((fmt_item,) * len(chunk)) % tuple(chunk)
+    else:
+        def format_chunk(chunk):
+            return ", ".join(map(repr, chunk))
 
     fw('[')
-    if fbx_elem.elems:
-        fw('\n')
-        ident_sub = ident + "    "
-        for fbx_elem_sub in fbx_elem.elems:
-            fbx2json_recurse(fw, fbx_elem_sub, ident_sub,
-                             fbx_elem_sub is fbx_elem.elems[-1])
+    for i in range(0, size, chunk_size):
+        if i != 0:
+            fw(', ')
+        fw(format_chunk(prop[i:i + chunk_size]))
     fw(']')
 
-    fw(']%s' % ('' if is_last else ',\n'))
+
+def fbx2json_properties_as_string(fbx_elem):
+    return ", ".join(fbx2json_property_as_string(*prop_item)
+                     for prop_item in zip(fbx_elem.props,
+                                          fbx_elem.props_type))
 
 
-def fbx2json(fn):
+def fbx2json_events(fw, events, float_precision=None):
+    """
+    Write the elements from ``events`` (see ``parse_bin.parse_events``),
+    a separator is written before each element after the first (at any depth),
+    since it's not known if an element is the last until its parent ends.
+    """
+    # for each depth, whether an element has been written
+    has_elems = [False]
+
+    for event, elem_id, elem_props, elem_props_type, depth in events:
+        if event == "start":
+            if has_elems[depth]:
+                fw(',\n')
+            elif depth != 0:
+                fw('\n')
+            has_elems[depth] = True
+
+            fw('%s["%s", ' % ("    " * (depth + 1), elem_id.decode('utf-8')))
+            fw('[')
+            for i, prop_item in enumerate(zip(elem_props, elem_props_type)):
+                if i != 0:
+                    fw(', ')
+                if type(prop_item[0]) == array.array:
+                    # arrays are written directly
+                    fbx2json_array_write(fw, prop_item[0], float_precision)
+                else:
+                    fw(fbx2json_property_as_string(*prop_item))
+            fw('], ')
+            fw('"%s", ' % (elem_props_type.decode('ascii')))
+            fw('[')
+
+            has_elems[depth + 1:] = [False]
+        else:
+            fw(']]')
+
+
+def fbx2json(fn, verbose=True, float_precision=None, stats=None):
     import os
 
     fn_json = "%s.json" % os.path.splitext(fn)[0]
-    print("Writing: %r " % fn_json, end="")
-    fbx_root_elem, fbx_version = parse(fn, use_namedtuple=True)
-    print("(Version %d) ..." % fbx_version)
+    if verbose:
+        print("Writing: %r " % fn_json, end="")
+    fbx_events, fbx_version = parse_events(fn, stats)
+    if verbose:
+        print("(Version %d) ..." % fbx_version)
 
     with open(fn_json, 'w', encoding="ascii", errors='xmlcharrefreplace') as f:
         fw = f.write
         fw('[\n')
-        ident_sub = "    "
-        for fbx_elem_sub in fbx_root_elem.elems:
-            fbx2json_recurse(f.write, fbx_elem_sub, ident_sub,
-                             fbx_elem_sub is fbx_root_elem.elems[-1])
+        fbx2json_events(fw, fbx_events, float_precision)
         fw(']\n')
 
+    return fn_json, fbx_version
+
+
+# ----------------------------------------------------------------------------
+# Batch Conversion
+
+def fbx2json_stats_report(stats, t):
+    """
+    Return the text for ``--stats``, where ``t`` is the time taken to convert the file.
+    """
+    return "%s\nJSON writing: %.4f sec\n" % (stats.report(), t - stats.time_total)
+
+
+def fbx2json_job(fn, float_precision=None, use_stats=False):
+    """
+    Convert ``fn`` in a worker process,
+    returning (fn, fn_json, fbx_version, time, fbx size, json size, error, stats report).
+    Errors are returned as text since tracebacks can't be sent between processes.
+    """
+    import os
+    import time
+
+    stats = parse_bin.FBXParseStats() if use_stats else None
+    t = time.perf_counter()
+    try:
+        fn_json, fbx_version = fbx2json(fn, verbose=False, float_precision=float_precision, stats=stats)
+    except:
+        import traceback
+        return fn, None, None, time.perf_counter() - t, None, None, traceback.format_exc(), None
+    t = time.perf_counter() - t
+
+    return (fn, fn_json, fbx_version, t, os.path.getsize(fn), os.path.getsize(fn_json), None,
+            fbx2json_stats_report(stats, t) if use_stats else None)
+
+
+def fbx2json_batch(files, jobs, float_precision=None, use_stats=False):
+    """
+    Convert ``files`` across ``jobs`` processes, returning the number of failures.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    results = [None] * len(files)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(fbx2json_job, fn, float_precision, use_stats): i
+                   for i, fn in enumerate(files)}
+        for future in as_completed(futures):
+            fn, fn_json, fbx_version, t, size_fbx, size_json, error, stats_report = result = future.result()
+            results[futures[future]] = result
+            if error is None:
+                print("Writing: %r (Version %d) ..." % (fn_json, fbx_version))
+                if stats_report is not None:
+                    print(stats_report)
+            else:
+                print("Failed to convert %r, error:" % fn)
+                print(error, end="")
+
+    print("\nSummary:")
+    failed = 0
+    t_total = 0.0
+    for fn, fn_json, fbx_version, t, size_fbx, size_json, error, stats_report in results:
+        t_total += t
+        if error is None:
+            print("    %-40s %8.3f sec %12d -> %12d bytes" % (fn, t, size_fbx, size_json))
+        else:
+            print("    %-40s %8.3f sec FAILED" % (fn, t))
+            failed += 1
+    print("%d file(s), %d failed, %.3f sec total (across %d jobs)" % (len(files), failed, t_total, jobs))
+
+    return failed
+
 
 # ----------------------------------------------------------------------------
 # Command Line
@@ -301,17 +655,49 @@ def main():
 
     if "--help" in sys.argv:
         print(__doc__)
-        return
-
-    for arg in sys.argv[1:]:
+        return 0
+
+    jobs = 0
+    float_precision = None
+    use_stats = False
+    files = []
+    args = iter(sys.argv[1:])
+    for arg in args:
+        if arg.startswith("--jobs="):
+            jobs = int(arg[7:])
+        elif arg == "--jobs":
+            jobs = int(next(args))
+        elif arg.startswith("--float-precision="):
+            float_precision = int(arg[18:])
+        elif arg == "--stats":
+            use_stats = True
+        else:
+            files.append(arg)
+
+    if jobs:
+        return 1 if fbx2json_batch(files, jobs, float_precision, use_stats) else 0
+
+    failed = 0
+    for arg in files:
         try:
-            fbx2json(arg)
+            if use_stats:
+                import time
+                stats = parse_bin.FBXParseStats()
+                t = time.perf_counter()
+                fbx2json(arg, float_precision=float_precision, stats=stats)
+                print(fbx2json_stats_report(stats, time.perf_counter() - t))
+            else:
+                fbx2json(arg, float_precision=float_precision)
         except:
             print("Failed to convert %r, error:" % arg)
 
             import traceback
             traceback.print_exc()
+            failed += 1
+
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
-    main()
+    import sys
+    sys.exit(main())
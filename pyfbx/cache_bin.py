@@ -0,0 +1,277 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Cache of parsed binary FBX files.
+
+Results of ``parse_bin.parse`` are kept in memory (least recently used first out,
+within a byte budget) and optionally pickled to a directory,
+so repeated loads of an unchanged file skip parsing.
+Files are considered unchanged when their size and modification time match
+(and optionally a hash of their contents).
+"""
+
+__all__ = (
+    "FBXParseCache",
+    "elem_size_estimate",
+    )
+
+from collections import OrderedDict
+from struct import pack, unpack_from
+import os
+import pickle
+import sys
+import threading
+
+from . import parse_bin, index_bin
+
+_CACHE_MAGIC = b'pyfbx cache\x00'
+_CACHE_FORMAT_VERSION = 1
+_CACHE_EXT = ".fbxcache"
+
+# default in-memory budget (in bytes)
+_CACHE_MAX_BYTES = 1 << 30
+
+
+def elem_size_estimate(elem_root):
+    """
+    Return an estimate of the memory used by the element tree ``elem_root`` (in bytes).
+
+    Arrays and strings are counted with their data, NumPy arrays which view another buffer
+    count the data they view. Lazy arrays count the inflated array whether it has been inflated
+    yet or not (so results aren't under-counted before they're accessed), and their compressed
+    data while it's held.
+    memoryviews (see ``parse(..., use_mmap=True)``) only count the view itself.
+    """
+    getsizeof = sys.getsizeof
+    FBXLazyArray = parse_bin.FBXLazyArray
+    size = 0
+    stack = [elem_root]
+    while stack:
+        elem = stack.pop()
+        size += getsizeof(elem) + getsizeof(elem[1]) + getsizeof(elem[3])
+        for prop in elem[1]:
+            size += getsizeof(prop)
+            prop_type = type(prop)
+            if prop_type is FBXLazyArray:
+                data = prop._data
+                if data is not None:
+                    size += len(data)
+                size += len(prop) * prop.itemsize
+            elif getattr(prop, "base", None) is not None and hasattr(prop, "dtype"):
+                # NumPy views (from 'np.frombuffer'), 'getsizeof' only counts the header
+                size += prop.nbytes
+        stack.extend(elem[3])
+    return size
+
+
+class FBXParseCache:
+    """
+    Cache of ``parse_bin.parse`` results, see: ``FBXParseCache.parse``.
+
+    Cached results are shared between callers, they must not be modified.
+
+    The counters ``hits``, ``misses`` and ``evictions`` are for the in-memory cache,
+    ``disk_hits`` and ``disk_writes`` for the cache directory.
+    """
+    __slots__ = (
+        "max_bytes",
+        "cache_dir",
+        "use_hash",
+        "size",
+        "hits",
+        "misses",
+        "evictions",
+        "disk_hits",
+        "disk_writes",
+        # key: (file key, result, size)
+        "_entries",
+        "_lock",
+        )
+
+    def __init__(self, max_bytes=_CACHE_MAX_BYTES, cache_dir=None, use_hash=False):
+        """
+        :arg max_bytes: Memory budget for cached results (see ``elem_size_estimate``),
+           results which don't fit on their own are only stored in ``cache_dir``.
+        :arg cache_dir: Directory to store pickled results in, when None, only memory is used.
+        :arg use_hash: Detect changes by content hash,
+           as well as the file size and modification time.
+        """
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.use_hash = use_hash
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        self.disk_writes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "size": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "disk_hits": self.disk_hits,
+            "disk_writes": self.disk_writes,
+            }
+
+    def clear(self):
+        """
+        Remove all results from memory (the cache directory is kept).
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def parse(self, fn, use_namedtuple=True, use_mmap=False, lazy_arrays=False, elem_filter=None,
+              executor=None, array_backend='array', intern_strings=True, stats=None):
+        """
+        Return the root element and FBX version of ``fn``,
+        as ``parse_bin.parse`` (which takes the same arguments).
+        ``stats`` is only filled in when the file is parsed, not for cached results.
+
+        Results are cached per file and arguments (except ``executor`` & ``stats``),
+        ``elem_filter`` is compared by identity, so reuse the same function to share results.
+
+        Results are stored in ``cache_dir`` unless ``use_mmap``, ``lazy_arrays`` or ``elem_filter`` is given
+        (views & lazy arrays aren't stored, nor can the filter be compared between processes).
+        """
+        options = (use_namedtuple, use_mmap, lazy_arrays, elem_filter, array_backend, intern_strings)
+        key = (os.path.abspath(fn), options)
+        file_key = index_bin.index_file_key(fn, self.use_hash)
+
+        entries = self._entries
+        with self._lock:
+            entry = entries.get(key)
+            if entry is not None:
+                if entry[0] == file_key:
+                    entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                # the file changed
+                del entries[key]
+                self.size -= entry[2]
+            self.misses += 1
+
+        result = None
+        fn_cache = None
+        if self.cache_dir is not None and elem_filter is None and not (use_mmap or lazy_arrays):
+            fn_cache = cache_path(fn, options, self.cache_dir)
+            result = cache_load(fn_cache, file_key)
+            if result is not None:
+                with self._lock:
+                    self.disk_hits += 1
+
+        if result is None:
+            result = parse_bin.parse(fn, use_namedtuple, use_mmap, lazy_arrays, elem_filter,
+                                     executor, array_backend, intern_strings, stats)
+            if fn_cache is not None and cache_save(fn_cache, file_key, result):
+                with self._lock:
+                    self.disk_writes += 1
+
+        size = elem_size_estimate(result[0])
+        if size <= self.max_bytes:
+            with self._lock:
+                entry = entries.pop(key, None)
+                if entry is not None:
+                    # stored by another thread in the meantime
+                    self.size -= entry[2]
+                entries[key] = (file_key, result, size)
+                self.size += size
+                while self.size > self.max_bytes:
+                    entry = entries.popitem(last=False)[1]
+                    self.size -= entry[2]
+                    self.evictions += 1
+
+        return result
+
+
+# ----------------------------------------------------------------------------
+# Storage
+
+def cache_path(fn, options, cache_dir):
+    """
+    Return the location in ``cache_dir`` of the result for ``fn`` parsed with ``options``.
+    """
+    import hashlib
+    h = hashlib.sha1(os.path.abspath(fn).encode('utf-8', 'surrogateescape'))
+    h.update(repr(options).encode('utf-8'))
+    return os.path.join(cache_dir, h.hexdigest() + _CACHE_EXT)
+
+
+def cache_load(fn_cache, file_key):
+    """
+    Load a stored result, returning None when there is none or it's out of date.
+    Stored results which can't be loaded are removed.
+    """
+    try:
+        f = open(fn_cache, 'rb')
+    except OSError:
+        return None
+    try:
+        with f:
+            if f.read(len(_CACHE_MAGIC)) != _CACHE_MAGIC:
+                raise ValueError("Invalid header")
+            format_version, key_size = unpack_from(b'<IB', f.read(5))
+            if format_version != _CACHE_FORMAT_VERSION:
+                return None
+            if f.read(key_size) != file_key:
+                return None
+            return pickle.load(f)
+    except Exception:
+        # truncated, corrupt or not unpickled by this version (any error unpickling is possible)
+        try:
+            os.remove(fn_cache)
+        except OSError:
+            pass
+        return None
+
+
+def cache_save(fn_cache, file_key, result):
+    """
+    Store a result, returning False when it can't be pickled or written.
+    """
+    try:
+        data = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+    except (TypeError, pickle.PicklingError):
+        # memoryviews (lazy arrays of a memory-mapped file)
+        return False
+
+    # write to a temporary file first, so readers never see a partial result
+    fn_cache_tmp = fn_cache + ".%d.%d.tmp" % (os.getpid(), threading.get_ident())
+    try:
+        with open(fn_cache_tmp, 'wb') as f:
+            f.write(_CACHE_MAGIC)
+            f.write(pack(b'<IB', _CACHE_FORMAT_VERSION, len(file_key)))
+            f.write(file_key)
+            f.write(data)
+        os.replace(fn_cache_tmp, fn_cache)
+    except OSError:
+        return False
+    return True
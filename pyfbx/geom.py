@@ -0,0 +1,401 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Bulk decoding of ``Geometry`` arrays into flat arrays,
+suitable for passing directly to an importer (``foreach_set`` in Blender for e.g.).
+
+NumPy is used when available (returning NumPy arrays),
+otherwise ``array.array`` is returned.
+"""
+
+__all__ = (
+    "polygon_vertex_index_decode",
+    "layer_map",
+    "layer_element_map",
+    "geometry_decode",
+    "geometry_decode_all",
+    "FBXGeometry",
+    )
+
+import array
+
+from . import parse_bin
+
+from collections import namedtuple
+# elem: the 'Geometry' element.
+# vertices: flat vertex coordinates.
+# polys: (vertex_indices, loop_starts, loop_totals), see: polygon_vertex_index_decode.
+# layers: [(elem, values)], the layer elements mapped to loops (or polygons), see: layer_element_map.
+# layers_unsupported: [(elem, message)], layer elements which couldn't be mapped.
+FBXGeometry = namedtuple("FBXGeometry", ("elem", "vertices", "polys", "layers", "layers_unsupported"))
+del namedtuple
+
+# NumPy module, None when unavailable, see: numpy_get
+_numpy = ...
+
+# 0xff for bytes with the sign bit set, otherwise 0
+_sign_bytes = bytes(0xff if i & 0x80 else 0 for i in range(256))
+
+# layer element id: (data id, index id, components, domain)
+_layer_element_types = {
+    b'LayerElementUV': (b'UV', b'UVIndex', 2, 'LOOP'),
+    b'LayerElementNormal': (b'Normals', b'NormalsIndex', 3, 'LOOP'),
+    b'LayerElementColor': (b'Colors', b'ColorIndex', 4, 'LOOP'),
+    # material indices are the data, one for each polygon
+    b'LayerElementMaterial': (b'Materials', None, 1, 'POLYGON'),
+    }
+
+_layer_mapping_types = {
+    b'ByPolygonVertex',
+    b'ByVertice',
+    b'ByVertex',
+    b'ByPolygon',
+    b'AllSame',
+    }
+
+_layer_reference_types = {
+    b'Direct',
+    b'IndexToDirect',
+    b'Index',
+    }
+
+
+def numpy_get(use_numpy):
+    """
+    Return the NumPy module or None, ``use_numpy`` is None to use NumPy when it's installed.
+    """
+    global _numpy
+    if use_numpy is False:
+        return None
+    if _numpy is ...:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy = numpy
+    if _numpy is None and use_numpy:
+        raise ImportError("NumPy isn't available")
+    return _numpy
+
+
+def array_values(values):
+    # inflate lazy arrays once, rather than on each access
+    if type(values) is parse_bin.FBXLazyArray:
+        return values.inflate()
+    return values
+
+
+def array_typecode(values):
+    # array.array, memoryview (see: parse_bin.parse(..., use_mmap=True)) or a sequence of floats
+    typecode = getattr(values, "typecode", None) or getattr(values, "format", None)
+    return typecode if typecode in {'f', 'd', 'i', 'q'} else 'd'
+
+
+def elem_prop_first(elem, elem_id):
+    for elem_sub in elem.elems:
+        if elem_sub.id == elem_id:
+            return elem_sub.props[0] if elem_sub.props else None
+    return None
+
+
+# ----------------------------------------------------------------------------
+# Polygons
+
+def polygon_vertex_index_decode(fbx_polys, use_numpy=None):
+    """
+    Decode a ``PolygonVertexIndex`` array, where the last index of each polygon
+    is stored negative (as ``-(index + 1)``).
+
+    Returns ``(vertex_indices, loop_starts, loop_totals)``,
+    the vertex index for each loop, then the first loop & number of loops for each polygon
+    (32 bit integer arrays). Loops after the last polygon end form a polygon too.
+
+    ``use_numpy`` is None to use NumPy when it's installed,
+    False for ``array.array`` or True to require NumPy.
+    """
+    fbx_polys = array_values(fbx_polys)
+    np = numpy_get(use_numpy)
+    if np is not None:
+        return polygon_vertex_index_decode_numpy(fbx_polys, np)
+
+    from itertools import accumulate
+
+    vertex_indices = array.array('i', fbx_polys)
+    data = memoryview(vertex_indices).cast('B')
+
+    # Work on the bytes of the array, so only the polygons are looped over in Python.
+    # 0xff for each negative index (the last of each polygon), from the high byte of each int.
+    polys_end = bytes(data[0::4] if parse_bin._IS_BIG_ENDIAN else data[3::4]).translate(_sign_bytes)
+
+    # -(index + 1) == ~index, flip all bits of the negative indices at once
+    mask = bytearray(len(data))
+    for i in range(4):
+        mask[i::4] = polys_end
+    data = (int.from_bytes(data, 'little') ^ int.from_bytes(mask, 'little')).to_bytes(len(data), 'little')
+    vertex_indices = array.array('i')
+    vertex_indices.frombytes(data)
+
+    # each polygon's loops, including the last (an extra byte before each end, so it's counted)
+    polys = polys_end.replace(b'\xff', b'\x00\xff').split(b'\xff')
+    polys_trailing = polys.pop()
+    loop_totals = array.array('i', map(len, polys))
+    if polys_trailing:
+        loop_totals.append(len(polys_trailing))
+    loop_starts = array.array('i', accumulate(loop_totals, initial=0))
+    del loop_starts[-1]
+    return vertex_indices, loop_starts, loop_totals
+
+
+def polygon_vertex_index_decode_numpy(fbx_polys, np):
+    # see: polygon_vertex_index_decode
+    fbx_polys = np.asarray(fbx_polys, dtype=np.int32)
+    loop_len = len(fbx_polys)
+
+    polys_end = fbx_polys < 0
+    # -(index + 1) == ~index
+    vertex_indices = np.where(polys_end, ~fbx_polys, fbx_polys)
+
+    loop_ends = np.flatnonzero(polys_end)
+    if loop_len and (not len(loop_ends) or loop_ends[-1] != loop_len - 1):
+        loop_ends = np.append(loop_ends, loop_len - 1)
+
+    loop_starts = np.empty(len(loop_ends), dtype=np.int32)
+    loop_starts[:1] = 0
+    loop_starts[1:] = loop_ends[:-1] + 1
+    loop_totals = (loop_ends + 1 - loop_starts).astype(np.int32)
+    return vertex_indices, loop_starts, loop_totals
+
+
+# ----------------------------------------------------------------------------
+# Layers
+
+def layer_map(data, indices, mapping, reference, components, polys, domain='LOOP', use_numpy=None):
+    """
+    Resolve a layer element's values for each loop (or polygon), returned as a flat array.
+
+    :arg data: Values of the layer, ``components`` numbers for each item.
+    :arg indices: Index into ``data`` for each item when ``reference`` is ``IndexToDirect``
+       (otherwise unused, None to use ``data`` directly).
+    :arg mapping: ``MappingInformationType``, ``ByPolygonVertex``, ``ByVertice``,
+       ``ByPolygon`` or ``AllSame``.
+    :arg reference: ``ReferenceInformationType``, ``Direct`` or ``IndexToDirect``.
+    :arg polys: ``(vertex_indices, loop_starts, loop_totals)``, see: ``polygon_vertex_index_decode``.
+    :arg domain: ``'LOOP'`` or ``'POLYGON'`` (taking the value of each polygon's first loop).
+    :arg use_numpy: As for ``polygon_vertex_index_decode``.
+
+    Raises ``ValueError`` for unsupported mapping & reference types,
+    ``IndexError`` when the layer refers to values which don't exist.
+    """
+    if mapping not in _layer_mapping_types:
+        raise ValueError("unsupported mapping type %r" % mapping)
+    if reference not in _layer_reference_types:
+        raise ValueError("unsupported reference type %r" % reference)
+    if domain not in {'LOOP', 'POLYGON'}:
+        raise ValueError("unknown domain %r" % domain)
+
+    data = array_values(data)
+    if reference == b'Direct':
+        indices = None
+    elif indices is not None:
+        indices = array_values(indices)
+    vertex_indices, loop_starts, loop_totals = polys
+
+    np = numpy_get(use_numpy)
+    if np is not None:
+        return layer_map_numpy(data, indices, mapping, components, polys, domain, np)
+
+    from itertools import chain, repeat
+
+    typecode = array_typecode(data)
+    if type(data) is not array.array or data.typecode != typecode:
+        data = array.array(typecode, data)
+
+    # the item of the layer for each loop/polygon (None when it's the loop index)
+    if domain == 'LOOP':
+        items_len = len(vertex_indices)
+        if mapping == b'ByPolygonVertex':
+            items = None
+        elif mapping == b'ByPolygon':
+            items = chain.from_iterable(map(repeat, range(len(loop_totals)), loop_totals))
+        elif mapping == b'AllSame':
+            items = repeat(0, items_len)
+        else:
+            items = vertex_indices
+    else:
+        items_len = len(loop_totals)
+        if mapping == b'ByPolygonVertex':
+            items = loop_starts
+        elif mapping == b'ByPolygon':
+            items = None
+        elif mapping == b'AllSame':
+            items = repeat(0, items_len)
+        else:
+            items = map(vertex_indices.__getitem__, loop_starts)
+
+    if indices is not None:
+        if indices and min(indices) < 0:
+            # Python would wrap negative indices around
+            raise IndexError("layer index out of range")
+        if items is not None:
+            items = map(indices.__getitem__, items)
+        elif len(indices) == items_len:
+            items = indices
+        else:
+            items = map(indices.__getitem__, range(items_len))
+    elif items is None:
+        # the data is used as-is
+        if len(data) < items_len * components:
+            raise IndexError("layer index out of range")
+        return data[:items_len * components]
+
+    # gather the values, as the bytes of each item (of 'components' numbers)
+    data_bytes = data.tobytes()
+    data_bytes_len = len(data_bytes)
+    stride = data.itemsize * components
+    data_items = list(map(data_bytes.__getitem__, map(
+        slice, range(0, data_bytes_len - stride + 1, stride), range(stride, data_bytes_len + 1, stride))))
+
+    values = array.array(typecode)
+    values.frombytes(b''.join(map(data_items.__getitem__, items)))
+    return values
+
+
+def layer_map_numpy(data, indices, mapping, components, polys, domain, np):
+    # see: layer_map
+    vertex_indices, loop_starts, loop_totals = polys
+    data = np.asarray(data)
+    data_items = data[:len(data) - (len(data) % components)].reshape(-1, components)
+
+    if domain == 'LOOP':
+        if mapping == b'ByPolygonVertex':
+            items = np.arange(len(vertex_indices))
+        elif mapping == b'ByPolygon':
+            items = np.repeat(np.arange(len(loop_totals)), loop_totals)
+        elif mapping == b'AllSame':
+            items = np.zeros(len(vertex_indices), dtype=np.intp)
+        else:
+            items = np.asarray(vertex_indices)
+    else:
+        if mapping == b'ByPolygonVertex':
+            items = np.asarray(loop_starts)
+        elif mapping == b'ByPolygon':
+            items = np.arange(len(loop_totals))
+        elif mapping == b'AllSame':
+            items = np.zeros(len(loop_totals), dtype=np.intp)
+        else:
+            items = np.asarray(vertex_indices)[np.asarray(loop_starts)]
+
+    if indices is not None:
+        items = np.asarray(indices)[items]
+    if len(items) and (items.min() < 0 or items.max() >= len(data_items)):
+        # NumPy would wrap negative indices around
+        raise IndexError("layer index out of range")
+
+    return data_items[items].reshape(-1)
+
+
+def layer_element_map(fbx_layer, polys, use_numpy=None):
+    """
+    Resolve the values of the layer element ``fbx_layer``,
+    a ``LayerElementUV``, ``LayerElementNormal``, ``LayerElementColor`` (values for each loop)
+    or ``LayerElementMaterial`` (material indices for each polygon), see: ``layer_map``.
+    """
+    layer_type = _layer_element_types.get(fbx_layer.id)
+    if layer_type is None:
+        raise ValueError("unsupported layer element %r" % fbx_layer.id)
+    data_id, index_id, components, domain = layer_type
+
+    data = elem_prop_first(fbx_layer, data_id)
+    if data is None:
+        raise ValueError("layer element %r has no %r" % (fbx_layer.id, data_id))
+    # without an index array (as for materials), the data is used directly
+    indices = elem_prop_first(fbx_layer, index_id) if index_id is not None else None
+
+    return layer_map(
+        data, indices,
+        elem_prop_first(fbx_layer, b'MappingInformationType'),
+        elem_prop_first(fbx_layer, b'ReferenceInformationType'),
+        components, polys, domain, use_numpy)
+
+
+# ----------------------------------------------------------------------------
+# Geometry
+
+def geometry_decode(fbx_obj, use_numpy=None, layer_types=None):
+    """
+    Decode the ``Geometry`` element ``fbx_obj`` into flat arrays, returning an ``FBXGeometry``.
+
+    :arg layer_types: Ids of the layer elements to map (``b'LayerElementUV'`` ... etc),
+       None for all supported layer elements.
+    :arg use_numpy: As for ``polygon_vertex_index_decode``.
+
+    Only reads ``fbx_obj``, so separate geometry can be decoded on different threads.
+    """
+    np = numpy_get(use_numpy)
+
+    vertices = elem_prop_first(fbx_obj, b'Vertices')
+    vertices = array_values(vertices) if vertices is not None else array.array('d')
+    if np is not None:
+        vertices = np.asarray(vertices)
+
+    fbx_polys = elem_prop_first(fbx_obj, b'PolygonVertexIndex')
+    polys = polygon_vertex_index_decode(fbx_polys if fbx_polys is not None else (), use_numpy)
+
+    layers = []
+    layers_unsupported = []
+    for fbx_layer in fbx_obj.elems:
+        if fbx_layer.id not in _layer_element_types:
+            continue
+        if layer_types is not None and fbx_layer.id not in layer_types:
+            continue
+        try:
+            layers.append((fbx_layer, layer_element_map(fbx_layer, polys, use_numpy)))
+        except (ValueError, IndexError) as ex:
+            layers_unsupported.append((fbx_layer, str(ex)))
+
+    return FBXGeometry(fbx_obj, vertices, polys, layers, layers_unsupported)
+
+
+def geometry_decode_all(fbx_objs, executor=None, use_numpy=None, layer_types=None):
+    """
+    Decode each of the ``Geometry`` elements ``fbx_objs``,
+    returning a list of ``FBXGeometry`` (in the same order), see: ``geometry_decode``.
+
+    ``executor`` decodes the geometry in parallel,
+    either a ``concurrent.futures.ThreadPoolExecutor`` or a number of worker threads.
+    Threads run in parallel while inflating arrays (see ``parse(..., lazy_arrays=True)``)
+    and in NumPy, so decoding without NumPy gains little from them.
+    """
+    if executor is None:
+        return [geometry_decode(fbx_obj, use_numpy, layer_types) for fbx_obj in fbx_objs]
+
+    executor_owned = None
+    if isinstance(executor, int):
+        from concurrent.futures import ThreadPoolExecutor
+        executor = executor_owned = ThreadPoolExecutor(max_workers=executor)
+    # import once, rather than racing to import in each thread
+    numpy_get(use_numpy)
+    try:
+        futures = [executor.submit(geometry_decode, fbx_obj, use_numpy, layer_types) for fbx_obj in fbx_objs]
+        return [future.result() for future in futures]
+    finally:
+        if executor_owned is not None:
+            executor_owned.shutdown(wait=True)
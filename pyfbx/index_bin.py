@@ -0,0 +1,309 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Offset index for binary FBX files.
+
+The index stores the location of every element in the file,
+so elements can be read directly (by path or UUID) without parsing the whole file.
+Indices can be stored next to the file, or in a separate directory,
+they are rebuilt when the file changes.
+"""
+
+__all__ = (
+    "index",
+    "index_build",
+    "index_load",
+    "index_save",
+    "FBXIndex",
+    "FBXIndexEntry",
+    )
+
+from struct import pack, unpack_from, calcsize, error as struct_error
+import os
+
+from . import parse_bin, data_types
+
+from collections import namedtuple
+# path: the element ids from the top-level element down to (and including) this one.
+# uuid: the first property when it's an INT64 (as used for objects & connections), otherwise None.
+# parent: index of the parent entry, -1 for top-level elements.
+FBXIndexEntry = namedtuple("FBXIndexEntry", (
+    "path", "id", "offset", "end_offset", "prop_count", "props_type", "uuid", "parent"))
+del namedtuple
+
+_INDEX_MAGIC = b'pyfbx index\x00'
+_INDEX_FORMAT_VERSION = 1
+_INDEX_EXT = ".fbxidx"
+
+# parent, offset, end_offset, prop_count, has_uuid, uuid, id length
+_ENTRY_HEAD = b'<iQQI?qB'
+_ENTRY_HEAD_SIZE = calcsize(_ENTRY_HEAD)
+
+
+# ----------------------------------------------------------------------------
+# Build
+
+def index_build(fn):
+    """
+    Walk the file ``fn``, returning a list of ``FBXIndexEntry`` (in file order)
+    and the FBX version.
+    """
+    # the entry fields, a list for each (filled in as elements are read)
+    paths = []
+    elem_ids = []
+    offsets = []
+    end_offsets = []
+    props_types = []
+    uuids = []
+    parents = []
+    # entry index of the elements being read (the path to the current element)
+    stack = []
+
+    f = open(fn, 'rb')
+    try:
+        read = f.read
+        if read(len(parse_bin._HEAD_MAGIC)) != parse_bin._HEAD_MAGIC:
+            raise IOError("Invalid header")
+        fbx_version = parse_bin.read_uint(read)
+    except:
+        f.close()
+        raise
+    tell = f.tell
+
+    # arrays are kept compressed, they're not needed here
+    events = parse_bin.read_elem_events(
+        f, parse_bin.read_data_dict_lazy, None, parse_bin.elem_head_struct(fbx_version))
+    for event, elem_id, elem_props_data, elem_props_type, depth, offset in events:
+        if event == "end":
+            # the file is positioned at the end of the element (after its nested list)
+            end_offsets[stack.pop()] = tell()
+            continue
+
+        if stack:
+            parent = stack[-1]
+            paths.append(paths[parent] + (elem_id,))
+        else:
+            parent = -1
+            paths.append((elem_id,))
+        stack.append(len(elem_ids))
+        elem_ids.append(elem_id)
+        offsets.append(offset)
+        end_offsets.append(None)
+        props_types.append(bytes(elem_props_type))
+        has_uuid = elem_props_type and elem_props_type[0] == data_types.INT64
+        uuids.append(elem_props_data[0] if has_uuid else None)
+        parents.append(parent)
+
+    entries = list(map(FBXIndexEntry, paths, elem_ids, offsets, end_offsets,
+                       map(len, props_types), props_types, uuids, parents))
+    return entries, fbx_version
+
+
+# ----------------------------------------------------------------------------
+# Storage
+
+def index_path(fn, index_dir=None):
+    """
+    Return the location of the index for ``fn``,
+    next to the file or (when ``index_dir`` is given) in ``index_dir``.
+    """
+    if index_dir is None:
+        return fn + _INDEX_EXT
+    import hashlib
+    key = hashlib.sha1(os.path.abspath(fn).encode('utf-8', 'surrogateescape')).hexdigest()
+    return os.path.join(index_dir, key + _INDEX_EXT)
+
+
+def index_file_key(fn, use_hash):
+    """
+    Return the bytes used to detect changes to ``fn``,
+    its size and modification time, and optionally a hash of its contents.
+    """
+    st = os.stat(fn)
+    key = pack(b'<QQ', st.st_size, st.st_mtime_ns)
+    if use_hash:
+        import hashlib
+        h = hashlib.sha1()
+        with open(fn, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        key += h.digest()
+    return key
+
+
+def index_save(fn, entries, fbx_version, index_dir=None, use_hash=False):
+    chunks = []
+    fw = chunks.append
+    for entry in entries:
+        fw(pack(_ENTRY_HEAD, entry.parent, entry.offset, entry.end_offset, entry.prop_count,
+                entry.uuid is not None, entry.uuid or 0, len(entry.id)))
+        fw(entry.id)
+        fw(pack(b'<I', len(entry.props_type)))
+        fw(entry.props_type)
+
+    key = index_file_key(fn, use_hash)
+
+    fn_index = index_path(fn, index_dir)
+    # write to a temporary file first, so readers never see a partial index
+    fn_index_tmp = fn_index + ".%d.tmp" % os.getpid()
+    with open(fn_index_tmp, 'wb') as f:
+        f.write(_INDEX_MAGIC)
+        f.write(pack(b'<IIBI', _INDEX_FORMAT_VERSION, fbx_version, len(key), len(entries)))
+        f.write(key)
+        f.write(b''.join(chunks))
+    os.replace(fn_index_tmp, fn_index)
+    return fn_index
+
+
+def index_load(fn, index_dir=None, use_hash=False):
+    """
+    Load the index for ``fn``, returning the entries and FBX version,
+    or None when there is no index or it's out of date.
+    """
+    fn_index = index_path(fn, index_dir)
+    try:
+        with open(fn_index, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    if not data.startswith(_INDEX_MAGIC):
+        return None
+    try:
+        return index_load_data(fn, data, use_hash)
+    except (struct_error, IndexError):
+        # truncated or corrupt, rebuilt by the caller
+        return None
+
+
+def index_load_data(fn, data, use_hash):
+    # see: index_load
+    offset = len(_INDEX_MAGIC)
+    format_version, fbx_version, key_size, entries_len = unpack_from(b'<IIBI', data, offset)
+    offset += 13
+    if format_version != _INDEX_FORMAT_VERSION:
+        return None
+    if data[offset:offset + key_size] != index_file_key(fn, use_hash):
+        return None
+    offset += key_size
+
+    entries = [None] * entries_len
+    for i in range(entries_len):
+        (parent, elem_offset, end_offset, prop_count,
+         has_uuid, uuid, elem_id_size) = unpack_from(_ENTRY_HEAD, data, offset)
+        offset += _ENTRY_HEAD_SIZE
+        elem_id = data[offset:offset + elem_id_size]
+        offset += elem_id_size
+        props_type_size = unpack_from(b'<I', data, offset)[0]
+        offset += 4
+        props_type = data[offset:offset + props_type_size]
+        offset += props_type_size
+        if not -1 <= parent < i:
+            raise IndexError("parent out of range")
+
+        path = (entries[parent].path if parent != -1 else ()) + (elem_id,)
+        entries[i] = FBXIndexEntry(path, elem_id, elem_offset, end_offset,
+                                   prop_count, props_type, uuid if has_uuid else None, parent)
+
+    if offset != len(data):
+        raise IndexError("index size doesn't match its entries")
+    return entries, fbx_version
+
+
+# ----------------------------------------------------------------------------
+# Access
+
+class FBXIndex:
+    """
+    Index of a binary FBX file, see: ``index``.
+    """
+    __slots__ = (
+        "fn",
+        "fbx_version",
+        "entries",
+        "_uuid_lookup",
+        )
+
+    def __init__(self, fn, entries, fbx_version):
+        self.fn = fn
+        self.fbx_version = fbx_version
+        self.entries = entries
+        self._uuid_lookup = None
+
+    def find_uuid(self, uuid, elem_id=None):
+        """
+        Return the entry for the object with ``uuid`` (an ``Objects`` child),
+        or None.
+        """
+        uuid_lookup = self._uuid_lookup
+        if uuid_lookup is None:
+            uuid_lookup = self._uuid_lookup = {
+                entry.uuid: entry for entry in self.entries
+                if entry.uuid is not None and len(entry.path) == 2 and entry.path[0] == b'Objects'}
+        entry = uuid_lookup.get(uuid)
+        if entry is not None and elem_id is not None and entry.id != elem_id:
+            return None
+        return entry
+
+    def find_path(self, path):
+        """
+        Return all entries matching ``path``, e.g. ``"Objects/Geometry"``
+        (``*`` matches any id).
+        """
+        if isinstance(path, str):
+            path = path.encode('utf-8')
+        pattern = tuple(path.strip(b'/').split(b'/'))
+        depth = len(pattern)
+        return [entry for entry in self.entries
+                if len(entry.path) == depth and
+                all(p == b'*' or p == e for p, e in zip(pattern, entry.path))]
+
+    def read_elem(self, entry, use_namedtuple=True, lazy_arrays=False):
+        """
+        Read the element (including its nested elements) for ``entry``.
+        """
+        read_data = parse_bin.read_data_dict_lazy if lazy_arrays else parse_bin.read_data_dict
+        with open(self.fn, 'rb') as f:
+            f.seek(entry.offset)
+            return parse_bin.read_elem(f.read, f.tell, use_namedtuple, read_data,
+                                       elem_head=parse_bin.elem_head_struct(self.fbx_version))
+
+
+def index(fn, index_dir=None, use_hash=False):
+    """
+    Return an ``FBXIndex`` for ``fn``,
+    loading a stored index when it's up to date, otherwise building and storing it.
+
+    :arg index_dir: Directory to store the index in,
+       when None, it's stored next to ``fn``.
+    :arg use_hash: Detect changes by content hash,
+       as well as the file size and modification time.
+    """
+    result = index_load(fn, index_dir, use_hash)
+    if result is None:
+        result = index_build(fn)
+        try:
+            index_save(fn, result[0], result[1], index_dir, use_hash)
+        except OSError:
+            # read-only location, the index is still usable
+            pass
+    entries, fbx_version = result
+    return FBXIndex(fn, entries, fbx_version)
@@ -0,0 +1,395 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Parser for ASCII FBX files, producing the same ``FBXElem`` tree as ``parse_bin.parse``.
+
+ASCII files don't store property types, they're chosen to match binary files:
+
+- integers are ``I`` (32 bit) or ``L`` (64 bit) when out of range,
+  object ids (the first property of ``Objects`` children) and connections are always ``L``.
+- real numbers are ``D``, bare ``Y``/``T`` & ``N``/``F`` values are ``C`` (bool).
+- ``P`` values (of ``Properties70``) are typed by the property type, as in binary files,
+  ``D`` for ``double``, ``Number``, ``ColorRGB``, ``Visibility`` ... etc.
+  (even when written without a decimal point), ``L`` for ``KTime`` & ``ULongLong``
+  and ``I`` for ``int``, ``enum`` and ``bool``.
+- strings are ``S``, ``Class::Name`` is stored as ``Name\\x00\\x01Class`` (as in binary files).
+- arrays (``*N { a: ... }``, or long number lists in older files)
+  use the type of the binary element where known, otherwise
+  ``d`` for real numbers and ``i`` (or ``l``) for integers.
+"""
+
+__all__ = (
+    "parse",
+    )
+
+from itertools import chain
+import array
+import re
+
+from .parse_bin import FBXElem
+
+# ';' comments, white-space and commas (between properties) are skipped before each token,
+# the token type is the index of the matching group.
+_token_re = re.compile(br'''
+    (?:\s+|;[^\n]*|,)*
+    (?:
+        ([A-Za-z_][\w|\-]*)[ \t]*:                        # 1: key
+      | "([^"]*)"                                        # 2: string
+      | ([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)        # 3: number
+      | \*(\d+)                                          # 4: array count
+      | ([A-Za-z_]\w*)                                   # 5: word
+      | (\{)                                             # 6: open
+      | (\})                                             # 7: close
+      | (\Z)                                             # 8: end
+    )''', re.VERBOSE)
+_TOKEN_KEY = 1
+_TOKEN_STRING = 2
+_TOKEN_NUMBER = 3
+_TOKEN_COUNT = 4
+_TOKEN_WORD = 5
+_TOKEN_OPEN = 6
+_TOKEN_CLOSE = 7
+
+_number = br'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+_number_re = re.compile(_number)
+# size of the text converted at once (in bytes), see: number_tokens
+_NUMBER_CHUNK_SIZE = 1 << 16
+# a list of numbers (without the '*N { a: ... }' block of FBX 7.x)
+_number_list_re = re.compile(br'\s*' + _number + br'(?:\s*,\s*' + _number + br')*')
+# the start of an array block, after the '*N' count
+_array_block_re = re.compile(br'\s*\{\s*a\s*:')
+_class_name_re = re.compile(br'^(\w+)::')
+_version_re = re.compile(br'; FBX (\d+)\.(\d+)\.(\d+)')
+
+# array type of known elements, as stored in binary files
+_array_elem_types = {
+    b'Vertices': b'd'[0],
+    b'PolygonVertexIndex': b'i'[0],
+    b'Edges': b'i'[0],
+    b'Normals': b'd'[0],
+    b'NormalsW': b'd'[0],
+    b'NormalsIndex': b'i'[0],
+    b'Binormals': b'd'[0],
+    b'BinormalsW': b'd'[0],
+    b'BinormalsIndex': b'i'[0],
+    b'Tangents': b'd'[0],
+    b'TangentsW': b'd'[0],
+    b'TangentsIndex': b'i'[0],
+    b'UV': b'd'[0],
+    b'UVIndex': b'i'[0],
+    b'Colors': b'd'[0],
+    b'ColorIndex': b'i'[0],
+    b'Materials': b'i'[0],
+    b'Smoothing': b'i'[0],
+    b'EdgeCrease': b'd'[0],
+    b'VertexCrease': b'd'[0],
+    b'KeyTime': b'l'[0],
+    b'KeyValueFloat': b'f'[0],
+    b'KeyAttrFlags': b'i'[0],
+    b'KeyAttrDataFloat': b'f'[0],
+    b'KeyAttrRefCount': b'i'[0],
+    b'Indexes': b'i'[0],
+    b'Weights': b'd'[0],
+    b'Transform': b'd'[0],
+    b'TransformLink': b'd'[0],
+    b'TransformAssociateModel': b'd'[0],
+    b'Matrix': b'd'[0],
+    b'FullWeights': b'd'[0],
+    b'Points': b'd'[0],
+    b'KnotVector': b'd'[0],
+    b'KnotVectorU': b'd'[0],
+    b'KnotVectorV': b'd'[0],
+    }
+
+# (array.array type, NumPy dtype, conversion)
+_array_type_dict = {
+    b'f'[0]: ('f', '<f4', float),
+    b'i'[0]: ('i', '<i4', int),
+    b'd'[0]: ('d', '<f8', float),
+    b'l'[0]: ('q', '<i8', int),
+    }
+
+# type code of 'P' values by property type (the second property), see: parse_data
+_prop_value_types = {
+    b'double': b'D'[0],
+    b'Number': b'D'[0],
+    b'Real': b'D'[0],
+    b'Distance': b'D'[0],
+    b'FieldOfView': b'D'[0],
+    b'FieldOfViewX': b'D'[0],
+    b'FieldOfViewY': b'D'[0],
+    b'OpticalCenterX': b'D'[0],
+    b'OpticalCenterY': b'D'[0],
+    b'Roll': b'D'[0],
+    b'Visibility': b'D'[0],
+    b'ColorRGB': b'D'[0],
+    b'Color': b'D'[0],
+    b'ColorAndAlpha': b'D'[0],
+    b'Vector3D': b'D'[0],
+    b'Vector4D': b'D'[0],
+    b'Vector': b'D'[0],
+    b'Lcl Translation': b'D'[0],
+    b'Lcl Rotation': b'D'[0],
+    b'Lcl Scaling': b'D'[0],
+    b'KTime': b'L'[0],
+    b'ULongLong': b'L'[0],
+    b'int': b'I'[0],
+    b'Integer': b'I'[0],
+    b'enum': b'I'[0],
+    b'Enum': b'I'[0],
+    b'bool': b'I'[0],
+    b'Bool': b'I'[0],
+    b'Visibility Inheritance': b'I'[0],
+    }
+
+_INT32_MIN = -(1 << 31)
+_INT32_MAX = (1 << 31) - 1
+
+
+# ----------------------------------------------------------------------------
+# Values
+
+def string_from_ascii(value):
+    value = value.replace(b'&quot;', b'"')
+    m = _class_name_re.match(value)
+    if m is not None:
+        # 'Class::Name' -> 'Name\x00\x01Class'
+        value = value[m.end():] + b'\x00\x01' + m.group(1)
+    return value
+
+
+def array_from_ascii(data, start, end, elem_id, np):
+    """
+    Convert ``data[start:end]``, a comma separated list of numbers, to an array,
+    returning the array and its type code.
+    """
+    data_type = _array_elem_types.get(elem_id)
+    if data_type is None:
+        if data.find(b'.', start, end) != -1 or data.find(b'e', start, end) != -1 or data.find(b'E', start, end) != -1:
+            data_type = b'd'[0]
+        else:
+            data_type = b'i'[0]
+
+    array_type, dtype, convert = _array_type_dict[data_type]
+    if _number_re.search(data, start, end) is None:
+        return (array.array(array_type) if np is None else np.empty(0, dtype)), data_type
+
+    if np is not None:
+        text = data[start:end]
+        if data_type == b'i'[0]:
+            # parse as 64 bit, in case the values are out of range
+            data_array = np.fromstring(text, dtype='<i8', sep=',')
+            if data_array.min() < _INT32_MIN or data_array.max() > _INT32_MAX:
+                data_type = b'l'[0]
+            else:
+                data_array = data_array.astype(dtype)
+        else:
+            data_array = np.fromstring(text, dtype=dtype, sep=',')
+        return data_array, data_type
+
+    try:
+        data_array = array.array(array_type, map(convert, number_tokens(data, start, end)))
+    except OverflowError:
+        if data_type != b'i'[0]:
+            raise
+        data_type = b'l'[0]
+        data_array = array.array('q', map(int, number_tokens(data, start, end)))
+    return data_array, data_type
+
+
+def number_tokens(data, start, end):
+    """
+    Return an iterator over the comma separated numbers of ``data[start:end]`` (as bytes).
+
+    The text is split a chunk at a time, so there is never a list of all numbers in an array.
+    """
+    def chunks_split(start):
+        find = data.find
+        while start < end:
+            chunk_end = find(b',', start + _NUMBER_CHUNK_SIZE, end)
+            if chunk_end == -1:
+                chunk_end = end
+            yield data[start:chunk_end].split(b',')
+            start = chunk_end + 1
+
+    return chain.from_iterable(chunks_split(start))
+
+
+# ----------------------------------------------------------------------------
+# Parser
+
+def parse_data(data, use_namedtuple, np):
+    """
+    Parse the ASCII FBX ``data`` (bytes), returning the top-level elements.
+    """
+    token_match = _token_re.match
+
+    root_elems = []
+    elems = root_elems   # the list elements are added to
+    elem_path = ()       # ids of the enclosing elements
+    # (elems, elem_path) of the enclosing elements
+    stack = []
+
+    # the element properties are being added to
+    elem_id = None
+    elem_props_data = elem_props_type = elem_subtree = None
+    long_first = long_all = False
+
+    pos = 0
+    while True:
+        m = token_match(data, pos)
+        if m is None:
+            raise IOError("unexpected character at offset %d: %r" %
+                          (pos, data[pos:pos + 16]))
+        pos = m.end()
+        token_type = m.lastindex
+        token = m.group(token_type)
+
+        if token_type == _TOKEN_NUMBER:
+            if elem_props_data is None:
+                raise IOError("unexpected number at offset %d" % m.start())
+            value_type = None
+            if elem_id == b'P' and len(elem_props_type) > 1 and elem_props_type[1] == 83:  # b'S'[0]
+                value_type = _prop_value_types.get(elem_props_data[1])
+            if value_type == 68 or b'.' in token or b'e' in token or b'E' in token:
+                elem_props_data.append(float(token))
+                elem_props_type.append(68)  # b'D'[0]
+            else:
+                value = int(token)
+                elem_props_data.append(value)
+                if (value_type == 76 or long_all or (long_first and len(elem_props_data) == 1) or
+                        not (_INT32_MIN <= value <= _INT32_MAX)):
+                    elem_props_type.append(76)  # b'L'[0]
+                else:
+                    elem_props_type.append(73)  # b'I'[0]
+
+        elif token_type == _TOKEN_STRING:
+            if elem_props_data is None:
+                raise IOError("unexpected string at offset %d" % m.start())
+            if b'::' in token or b'&' in token:
+                token = string_from_ascii(token)
+            elem_props_data.append(token)
+            elem_props_type.append(83)  # b'S'[0]
+
+        elif token_type == _TOKEN_KEY:
+            elem_id = token
+            elem_props_data = []
+            elem_props_type = bytearray()
+            elem_subtree = []
+
+            args = (elem_id, elem_props_data, elem_props_type, elem_subtree)
+            elems.append(FBXElem(*args) if use_namedtuple else args)
+
+            # ids are 64 bit, as in binary files
+            long_first = (elem_path == (b'Objects',))
+            long_all = (elem_path == (b'Connections',))
+
+            # older files write arrays as plain number lists
+            if elem_id in _array_elem_types:
+                m = _number_list_re.match(data, pos)
+                if m is not None and data.count(b',', pos, m.end()) > 0:
+                    pos = m.end()
+                    value, data_type = array_from_ascii(data, m.start(), pos, elem_id, np)
+                    elem_props_data.append(value)
+                    elem_props_type.append(data_type)
+
+        elif token_type == _TOKEN_WORD:
+            if elem_props_data is None:
+                raise IOError("unexpected value at offset %d" % m.start())
+            if token in {b'Y', b'T', b'N', b'F'}:
+                elem_props_data.append(token in {b'Y', b'T'})
+                elem_props_type.append(67)  # b'C'[0]
+            else:
+                elem_props_data.append(token)
+                elem_props_type.append(83)  # b'S'[0]
+
+        elif token_type == _TOKEN_COUNT:
+            # '*N { a: ... }'
+            if elem_props_data is None:
+                raise IOError("unexpected array at offset %d" % m.start())
+            array_length = int(token)
+            m = _array_block_re.match(data, pos)
+            if m is None:
+                raise IOError("expected array block at offset %d" % pos)
+            pos = m.end()
+            pos_end = data.find(b'}', pos)
+            if pos_end == -1:
+                raise IOError("array block not closed, something is wrong")
+            value, data_type = array_from_ascii(data, pos, pos_end, elem_id, np)
+            pos = pos_end + 1
+            if len(value) != array_length:
+                raise IOError("array length %d doesn't match its count %d" % (len(value), array_length))
+            elem_props_data.append(value)
+            elem_props_type.append(data_type)
+
+        elif token_type == _TOKEN_OPEN:
+            if elem_subtree is None:
+                raise IOError("unexpected '{' at offset %d" % m.start())
+            stack.append((elems, elem_path))
+            elems = elem_subtree
+            elem_path = elem_path + (elem_id,)
+            elem_props_data = elem_props_type = elem_subtree = None
+
+        elif token_type == _TOKEN_CLOSE:
+            if not stack:
+                raise IOError("unexpected '}' at offset %d" % m.start())
+            elems, elem_path = stack.pop()
+            elem_props_data = elem_props_type = elem_subtree = None
+
+        else:  # end
+            if stack:
+                raise IOError("unexpected end of file, something is wrong")
+            return root_elems
+
+
+def parse(fn, use_namedtuple=True, array_backend='array'):
+    """
+    Parse the ASCII FBX file ``fn``,
+    returning the root element and the FBX version (as ``parse_bin.parse``).
+
+    ``array_backend`` is ``'array'`` for ``array.array`` or ``'numpy'`` for NumPy arrays,
+    numbers are converted in bulk (without per-value tokens) either way.
+    """
+    if array_backend == 'numpy':
+        import numpy as np
+    elif array_backend == 'array':
+        np = None
+    else:
+        raise ValueError("Unknown array backend %r" % array_backend)
+
+    with open(fn, 'rb') as f:
+        data = f.read()
+
+    root_elems = parse_data(data, use_namedtuple, np)
+
+    m = _version_re.search(data, 0, 1024)
+    if m is not None:
+        fbx_version = int(m.group(1)) * 1000 + int(m.group(2)) * 100 + int(m.group(3))
+    else:
+        fbx_version = 0
+        for elem in root_elems:
+            if elem[0] == b'FBXHeaderExtension':
+                for elem_sub in elem[3]:
+                    if elem_sub[0] == b'FBXVersion' and elem_sub[1]:
+                        fbx_version = elem_sub[1][0]
+
+    args = (b'', [], bytearray(0), root_elems)
+    return FBXElem(*args) if use_namedtuple else args, fbx_version
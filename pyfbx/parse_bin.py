@@ -24,133 +24,993 @@
 __all__ = (
     "parse",
     "FBXElem",
+    "FBXLazyArray",
+    "FBXParseStats",
+    "path_filter",
+    "parse_events",
     )
 
-from struct import unpack
+from struct import Struct
 import array
 import zlib
 
-# at the end of each nested block, there is a NUL record to indicate
-# that the sub-scope exists (i.e. to distinguish between P: and P : {})
-# this NUL record is 13 bytes long.
-_BLOCK_SENTINEL_LENGTH = 13
-_BLOCK_SENTINEL_DATA = (b'\0' * _BLOCK_SENTINEL_LENGTH)
 _IS_BIG_ENDIAN = (__import__("sys").byteorder != 'little')
+_HEAD_MAGIC = b'Kaydara FBX Binary\x20\x20\x00\x1a\x00'
 from collections import namedtuple
 FBXElem = namedtuple("FBXElem", ("id", "props", "props_type", "elems"))
 del namedtuple
 
+# returned by read_elem when the element is excluded by 'elem_filter'
+_ELEM_SKIP = object()
+
+
+def path_filter(include=(), exclude=()):
+    """
+    Return a function for ``parse(..., elem_filter=...)`` which matches
+    elements by their id path, e.g. ``"Objects/Geometry"``
+    (``*`` matches any id).
+
+    - Elements inside ``include`` paths are kept, as are their parents,
+      other elements are skipped (unless ``include`` is empty).
+    - Elements inside ``exclude`` paths are skipped.
+    """
+    def path_split(path):
+        if isinstance(path, str):
+            path = path.encode('utf-8')
+        return tuple(path.strip(b'/').split(b'/'))
+
+    def path_match(pattern, elem_path):
+        # compare the common prefix
+        for p, e in zip(pattern, elem_path):
+            if p != b'*' and p != e:
+                return False
+        return True
+
+    include = [path_split(path) for path in include]
+    exclude = [path_split(path) for path in exclude]
+
+    def elem_filter(elem_path):
+        depth = len(elem_path)
+        for pattern in exclude:
+            if depth >= len(pattern) and path_match(pattern, elem_path):
+                return False
+        if include:
+            # include parents of the paths too, so they can be reached
+            for pattern in include:
+                if path_match(pattern, elem_path):
+                    return True
+            return False
+        return True
+
+    return elem_filter
+
+
+class FBXLazyArray:
+    """
+    Stand-in for a compressed array property, see: ``parse(..., lazy_arrays=True)``.
+
+    Holds the compressed data, which is only inflated into an ``array.array``
+    once the values are accessed. The length is known up-front,
+    so ``len()`` doesn't need to inflate the data.
+
+    Before Python 3.12 it can't be used as a buffer (``memoryview(lazy_array)`` for e.g.),
+    use ``inflate()`` to access the ``array.array`` instead.
+    """
+    __slots__ = (
+        "_data",
+        "_array",
+        "_length",
+        "typecode",
+        "itemsize",
+        "_byteswap",
+        )
+
+    def __init__(self, data, array_type, array_length, array_stride, array_byteswap):
+        self._data = data
+        self._array = None
+        self._length = array_length
+        self.typecode = array_type
+        self.itemsize = array_stride
+        self._byteswap = array_byteswap
+
+    def inflate(self):
+        data_array = self._array
+        if data_array is None:
+            data_array = inflate_array(array.array(self.typecode), self._data,
+                                       self._length, self.itemsize, self._byteswap)
+            self._array = data_array
+            # no need to keep the compressed data (or the buffer it references)
+            self._data = None
+        return data_array
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        return self.inflate()[index]
+
+    def __iter__(self):
+        return iter(self.inflate())
+
+    def __eq__(self, other):
+        if type(other) is FBXLazyArray:
+            other = other.inflate()
+        return self.inflate() == other
+
+    # Python 3.12+, allows memoryview(), array.array(), bpy's foreach_set ... to use the buffer directly.
+    def __buffer__(self, flags):
+        return memoryview(self.inflate())
+
+    def __getattr__(self, attr):
+        # Private & special names aren't forwarded, they're looked up on objects
+        # which aren't initialized yet (when copying or unpickling).
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        # tolist, tobytes, buffer_info ... etc.
+        return getattr(self.inflate(), attr)
+
+    def __reduce__(self):
+        args = (None, self.typecode, self._length, self.itemsize, self._byteswap)
+        data_array = self._array
+        if data_array is None:
+            # the compressed data, copied as it may be a view of a memory-mapped file
+            return (FBXLazyArray, (bytes(self._data),) + args[1:])
+        return (FBXLazyArray, args, data_array)
+
+    def __setstate__(self, data_array):
+        self._array = data_array
+
+    def __repr__(self):
+        if self._array is None:
+            return "FBXLazyArray('%s', <%d items, compressed>)" % (self.typecode, self._length)
+        return repr(self._array)
+
+
+class FBXParseStats:
+    """
+    Statistics of a parse, see: ``parse(..., stats=FBXParseStats())`` & ``report``.
+
+    - ``file_size``: size of the file (in bytes).
+    - ``bytes_read``: bytes of the file read, elements skipped by ``elem_filter`` aren't counted
+      (otherwise the same as ``file_size``).
+    - ``elem_count``: number of elements by id.
+    - ``prop_count``, ``prop_bytes``: number of properties by type code,
+      and the bytes they take in the file (excluding the type code).
+    - ``array_count_compressed``, ``array_bytes_compressed``, ``array_bytes_inflated``:
+      number of compressed arrays, their size in the file and once inflated.
+    - ``time_total``: time taken to parse.
+    - ``time_props``: time decoding property lists (including ``time_zlib``),
+      the remainder of ``time_total`` is spent walking the elements.
+    - ``time_zlib``: time inflating arrays (on the thread parsing the file).
+    - ``time_zlib_workers``: time inflating arrays on worker threads (see ``executor``),
+      summed across the threads.
+
+    Times are in seconds, including the overhead of measuring them.
+    """
+    __slots__ = (
+        "file_size",
+        "bytes_read",
+        "elem_count",
+        "prop_count",
+        "prop_bytes",
+        "array_count_compressed",
+        "array_bytes_compressed",
+        "array_bytes_inflated",
+        "time_total",
+        "time_props",
+        "time_zlib",
+        "time_zlib_workers",
+        )
+
+    def __init__(self):
+        self.file_size = 0
+        self.bytes_read = 0
+        self.elem_count = {}
+        self.prop_count = {}
+        self.prop_bytes = {}
+        self.array_count_compressed = 0
+        self.array_bytes_compressed = 0
+        self.array_bytes_inflated = 0
+        self.time_total = 0.0
+        self.time_props = 0.0
+        self.time_zlib = 0.0
+        self.time_zlib_workers = 0.0
+
+    def report(self, elem_limit=20):
+        """
+        Return the statistics as text, listing the ``elem_limit`` most common element ids.
+        """
+        lines = [
+            "File size: %d bytes (%d read)" % (self.file_size, self.bytes_read),
+            "Time: %.4f sec (walk %.4f, properties %.4f, zlib %.4f, zlib on workers %.4f)" % (
+                self.time_total,
+                self.time_total - self.time_props,
+                self.time_props - self.time_zlib,
+                self.time_zlib,
+                self.time_zlib_workers,
+                ),
+            "Compressed arrays: %d, %d -> %d bytes" % (
+                self.array_count_compressed, self.array_bytes_compressed, self.array_bytes_inflated),
+            "Properties:",
+            ]
+        for data_type, count in sorted(self.prop_count.items()):
+            lines.append("    %s %12d %16d bytes" % (chr(data_type), count, self.prop_bytes.get(data_type, 0)))
+
+        lines.append("Elements: %d" % sum(self.elem_count.values()))
+        elem_count = sorted(self.elem_count.items(), key=lambda item: (-item[1], item[0]))
+        for elem_id, count in elem_count[:elem_limit]:
+            lines.append("    %-32s %12d" % (elem_id.decode('utf-8', 'replace'), count))
+        if len(elem_count) > elem_limit:
+            lines.append("    (%d more)" % (len(elem_count) - elem_limit))
+        return "\n".join(lines)
+
+
+# compressed arrays smaller than this are inflated immediately,
+# instead of handing them to a worker.
+_ARRAY_SUBMIT_MIN_SIZE = 1 << 12
+
+_struct_uint = Struct(b'<I')
+# end_offset, prop_count, prop_length, elem_id size
+_struct_elem_head = Struct(b'<3IB')
+# FBX 7500 and later use 64-bit element header fields, for files over 4 GiB
+_struct_elem_head_64 = Struct(b'<3QB')
+_ELEM_HEAD_64_VERSION = 7500
+# length, encoding, compressed length
+_struct_array_head = Struct(b'<3I')
+
+# fixed size property types, (unpack_from, size)
+_scalar_unpack_dict = {
+    b'Y'[0]: (Struct(b'<h').unpack_from, 2),  # 16 bit int
+    b'C'[0]: (Struct(b'?').unpack_from, 1),   # 1 bit bool (yes/no)
+    b'I'[0]: (Struct(b'<i').unpack_from, 4),  # 32 bit int
+    b'F'[0]: (Struct(b'<f').unpack_from, 4),  # 32 bit float
+    b'D'[0]: (Struct(b'<d').unpack_from, 8),  # 64 bit float
+    b'L'[0]: (Struct(b'<q').unpack_from, 8),  # 64 bit int
+    }
+
+
+def inflate_array(data_array, data, array_length, array_stride, array_byteswap):
+    """
+    Inflate compressed array ``data`` into ``data_array`` (an empty ``array.array``).
+    """
+    data = zlib.decompress(data)
+    assert(array_length * array_stride == len(data))
+
+    data_array.frombytes(data)
+    if array_byteswap and _IS_BIG_ENDIAN:
+        data_array.byteswap()
+    return data_array
+
+
+def elem_head_struct(fbx_version):
+    """
+    Return the ``Struct`` for element headers in files of ``fbx_version``,
+    the NUL record (block sentinel) is the same size as the header.
+    """
+    return _struct_elem_head_64 if fbx_version >= _ELEM_HEAD_64_VERSION else _struct_elem_head
+
 
 def read_uint(read):
-    return unpack(b'<I', read(4))[0]
+    return _struct_uint.unpack(read(4))[0]
+
+
+# ----------------------------------------------------------------------------
+# Property Decoding
+#
+# Properties are decoded from a buffer by offset, either the entire file
+# (an mmap object) or the property list of a single element (bytes),
+# slicing either of these returns a copy as bytes.
+# Each function returns a (value, offset) pair,
+# where offset points to the first byte after the value.
+
+def read_uint_from(data, offset):
+    return _struct_uint.unpack_from(data, offset)[0], offset + 4
 
 
-def read_ubyte(read):
-    return unpack(b'B', read(1))[0]
+def read_string_uint_from(data, offset):
+    size = _struct_uint.unpack_from(data, offset)[0]
+    offset += 4
+    return data[offset:offset + size], offset + size
 
 
-def read_string_ubyte(read):
-    size = read_ubyte(read)
-    data = read(size)
-    return data
+def read_bytes_uint_from(data, offset):
+    # without copying, a view into 'data'
+    size = _struct_uint.unpack_from(data, offset)[0]
+    offset += 4
+    return memoryview(data)[offset:offset + size], offset + size
 
 
-def unpack_array(read, array_type, array_stride, array_byteswap):
-    length = read_uint(read)
-    encoding = read_uint(read)
-    comp_len = read_uint(read)
+def unpack_array_from(data, offset, array_type, array_stride, array_byteswap, lazy, view, submit):
+    length, encoding, comp_len = _struct_array_head.unpack_from(data, offset)
 
-    data = read(comp_len)
+    offset += 12
+    data_end = offset + comp_len
+
+    data_view = memoryview(data)[offset:data_end]
+
+    if encoding == 1 and lazy:
+        if not view:
+            data_view = data[offset:data_end]
+        return FBXLazyArray(data_view, array_type, length, array_stride, array_byteswap), data_end
+
+    if encoding == 1 and submit is not None and comp_len >= _ARRAY_SUBMIT_MIN_SIZE:
+        # the array is filled in by a worker, while reading continues
+        data_array = array.array(array_type)
+        submit(inflate_array, data_array, data_view, length, array_stride, array_byteswap)
+        return data_array, data_end
 
     if encoding == 0:
         pass
     elif encoding == 1:
-        data = zlib.decompress(data)
+        data_view = zlib.decompress(data_view)
+
+    assert(length * array_stride == len(data_view))
 
-    assert(length * array_stride == len(data))
+    if view and encoding == 0 and not (array_byteswap and _IS_BIG_ENDIAN):
+        # zero copy, the array is a typed view into the buffer
+        return data_view.cast(array_type), data_end
 
-    data_array = array.array(array_type, data)
+    # note, array.array(array_type, view) would read the view as a sequence of bytes
+    data_array = array.array(array_type)
+    data_array.frombytes(data_view)
     if array_byteswap and _IS_BIG_ENDIAN:
         data_array.byteswap()
-    return data_array
+    return data_array, data_end
 
 
-read_data_dict = {
-    b'Y'[0]: lambda read, size: unpack(b'<h', read(2))[0],  # 16 bit int
-    b'C'[0]: lambda read, size: unpack(b'?', read(1))[0],   # 1 bit bool (yes/no)
-    b'I'[0]: lambda read, size: unpack(b'<i', read(4))[0],  # 32 bit int
-    b'F'[0]: lambda read, size: unpack(b'<f', read(4))[0],  # 32 bit float
-    b'D'[0]: lambda read, size: unpack(b'<d', read(8))[0],  # 64 bit float
-    b'L'[0]: lambda read, size: unpack(b'<q', read(8))[0],  # 64 bit int
-    b'R'[0]: lambda read, size: read(read_uint(read)),      # binary data
-    b'S'[0]: lambda read, size: read(read_uint(read)),      # string data
-    b'f'[0]: lambda read, size: unpack_array(read, 'f', 4, False),  # array (float)
-    b'i'[0]: lambda read, size: unpack_array(read, 'i', 4, True),   # array (int)
-    b'd'[0]: lambda read, size: unpack_array(read, 'd', 8, False),  # array (double)
-    b'l'[0]: lambda read, size: unpack_array(read, 'q', 8, True),   # array (long)
-    b'b'[0]: lambda read, size: read(size),  # unknown
-    }
+def unpack_array_numpy_from(data, offset, dtype, submit, np):
+    length, encoding, comp_len = _struct_array_head.unpack_from(data, offset)
 
+    offset += 12
+    data_end = offset + comp_len
 
-def read_elem(read, tell, use_namedtuple):
-    # [0] the offset at which this block ends
-    # [1] the number of properties in the scope
-    # [2] the length of the property list
-    end_offset = read_uint(read)
-    if end_offset == 0:
-        return None
+    if encoding == 0:
+        # zero copy, a view into the buffer (read-only)
+        data_array = np.frombuffer(data, dtype, length, offset)
+        return data_array, data_end
+
+    data_view = memoryview(data)[offset:data_end]
+
+    if submit is not None and comp_len >= _ARRAY_SUBMIT_MIN_SIZE:
+        data_array = np.empty(length, dtype)
+        submit(inflate_array_numpy, data_array, data_view)
+        # read-only as the other arrays are, the worker fills in 'data_array'
+        data_array_view = data_array.view()
+        data_array_view.setflags(write=False)
+        return data_array_view, data_end
+
+    data = zlib.decompress(data_view)
+    assert(length * dtype.itemsize == len(data))
+    return np.frombuffer(data, dtype), data_end
+
+
+def inflate_array_numpy(data_array, data):
+    """
+    Inflate compressed array ``data`` into ``data_array`` (an empty NumPy array).
+    """
+    data = zlib.decompress(data)
+    assert(data_array.nbytes == len(data))
+    memoryview(data_array).cast('B')[:] = data
+    return data_array
 
-    prop_count = read_uint(read)
-    prop_length = read_uint(read)
 
-    elem_id = read_string_ubyte(read)        # elem name of the scope/key
+def read_data_dict_create(lazy=False, view=False, submit=None, array_backend='array', stats=None):
+    """
+    Create a dictionary of property readers, by type code.
+
+    :arg lazy: Compressed arrays are returned as ``FBXLazyArray``.
+    :arg view: Raw data and uncompressed arrays are returned as views into the buffer.
+    :arg submit: Function to run ``inflate_array`` and its arguments on a worker thread,
+       compressed arrays are returned empty, to be filled in by the worker.
+    :arg array_backend: ``'array'`` for ``array.array`` or ``'numpy'`` for NumPy arrays
+       (views into the buffer when uncompressed), ``lazy`` isn't supported with NumPy.
+    :arg stats: ``FBXParseStats`` to record arrays and the time inflating them in.
+    """
+    def scalar_read(unpack_from, size):
+        return lambda data, offset, size_all: (unpack_from(data, offset)[0], offset + size)
+
+    def array_read(array_type, array_stride, array_byteswap):
+        return lambda data, offset, size: unpack_array_from(
+            data, offset, array_type, array_stride, array_byteswap, lazy, view, submit)
+
+    read_data = {
+        data_type: scalar_read(unpack_from, size)
+        for data_type, (unpack_from, size) in _scalar_unpack_dict.items()
+        }
+
+    if view:
+        read_data[b'R'[0]] = lambda data, offset, size: read_bytes_uint_from(data, offset)  # binary data
+        read_data[b'b'[0]] = lambda data, offset, size: (  # unknown
+            memoryview(data)[offset:offset + size], offset + size)
+    else:
+        read_data[b'R'[0]] = lambda data, offset, size: read_string_uint_from(data, offset)  # binary data
+        read_data[b'b'[0]] = lambda data, offset, size: (data[offset:offset + size], offset + size)  # unknown
+
+    read_data.update({
+        b'S'[0]: lambda data, offset, size: read_string_uint_from(data, offset),  # string data
+        b'f'[0]: array_read('f', 4, False),  # array (float)
+        b'i'[0]: array_read('i', 4, True),   # array (int)
+        b'd'[0]: array_read('d', 8, False),  # array (double)
+        b'l'[0]: array_read('q', 8, True),   # array (long)
+        })
+
+    if array_backend == 'numpy':
+        import numpy as np
+
+        def array_read_numpy(dtype):
+            dtype = np.dtype(dtype)
+            return lambda data, offset, size: unpack_array_numpy_from(data, offset, dtype, submit, np)
+
+        read_data.update({
+            b'f'[0]: array_read_numpy('<f4'),  # array (float)
+            b'i'[0]: array_read_numpy('<i4'),  # array (int)
+            b'd'[0]: array_read_numpy('<f8'),  # array (double)
+            b'l'[0]: array_read_numpy('<i8'),  # array (long)
+            })
+    elif array_backend != 'array':
+        raise ValueError("Unknown array backend %r" % array_backend)
+
+    if stats is not None:
+        for data_type, array_stride in ((b'f'[0], 4), (b'i'[0], 4), (b'd'[0], 8), (b'l'[0], 8)):
+            read_data[data_type] = stats_array_read(stats, read_data[data_type], data_type, array_stride)
+
+    return read_data
+
+
+read_data_dict = read_data_dict_create()
+read_data_dict_lazy = read_data_dict_create(lazy=True)
+read_data_dict_view = read_data_dict_create(view=True)
+read_data_dict_view_lazy = read_data_dict_create(lazy=True, view=True)
+
+
+def read_elem_props_from(data, offset, prop_count, prop_length, read_data, intern=None):
+    """
+    Decode the property list of an element in one pass,
+    returning the property values, types and the offset after the list.
+
+    ``intern`` is an optional function (such as ``dict.setdefault`` of a per-parse table)
+    taking a string twice, returning a shared instance of the string.
+    """
     elem_props_type = bytearray(prop_count)  # elem property types
     elem_props_data = [None] * prop_count    # elem properties (if any)
-    elem_subtree = []                        # elem children (if any)
+
+    scalar_unpack_dict_get = _scalar_unpack_dict.get
+    uint_unpack_from = _struct_uint.unpack_from
 
     for i in range(prop_count):
-        data_type = read(1)[0]
-        elem_props_data[i] = read_data_dict[data_type](read, prop_length)
-        elem_props_type[i] = data_type
+        data_type = elem_props_type[i] = data[offset]
+
+        # inline the most common types (strings & numbers),
+        # others go through 'read_data'.
+        if data_type == 83:  # b'S'[0]
+            size = uint_unpack_from(data, offset + 1)[0]
+            offset += 5
+            value = data[offset:offset + size]
+            elem_props_data[i] = value if intern is None else intern(value, value)
+            offset += size
+            continue
+
+        offset += 1
+        scalar = scalar_unpack_dict_get(data_type)
+        if scalar is not None:
+            elem_props_data[i] = scalar[0](data, offset)[0]
+            offset += scalar[1]
+        else:
+            elem_props_data[i], offset = read_data[data_type](data, offset, prop_length)
+
+    return elem_props_data, elem_props_type, offset
+
+
+# ----------------------------------------------------------------------------
+# Buffer Access
+#
+# Walk a buffer (typically a memory-mapped file) by offset,
+# instead of calling read/tell on a file object.
+
+def read_elem_from(data, offset, use_namedtuple, read_data=read_data_dict_view,
+                   elem_filter=None, elem_path=(), intern=None, elem_head=_struct_elem_head,
+                   read_props=read_elem_props_from, skip=None):
+    # see: read_elem, ``skip`` is called with the size of elements skipped by ``elem_filter``.
+    elem_head_unpack_from = elem_head.unpack_from
+    elem_head_size = elem_head.size
+    sentinel_data = b'\0' * elem_head_size
+
+    stack = []
+    elem_root = elem_subtree_parent = []
+    scope_end = None
+
+    while True:
+        end_offset, prop_count, prop_length, elem_id_size = elem_head_unpack_from(data, offset)
+        if end_offset == 0:
+            if scope_end is not None:
+                raise IOError("unexpected NULL record, something is wrong")
+            return None, offset + elem_head_size
+
+        offset += elem_head_size
+        elem_id = data[offset:offset + elem_id_size]
+        offset += elem_id_size
+        if intern is not None:
+            elem_id = intern(elem_id, elem_id)
+
+        if elem_filter is not None:
+            elem_path_sub = elem_path + (elem_id,)
+            if not elem_filter(elem_path_sub):
+                if skip is not None:
+                    skip(end_offset - offset)
+                offset = end_offset
+                elem_id = None
+
+        if elem_id is not None:
+            elem_props_data, elem_props_type, offset = read_props(
+                data, offset, prop_count, prop_length, read_data, intern)
+            elem_subtree = []
+
+            args = (elem_id, elem_props_data, elem_props_type, elem_subtree)
+            elem_subtree_parent.append(FBXElem(*args) if use_namedtuple else args)
+
+            if offset < end_offset:
+                stack.append((elem_subtree_parent, scope_end, elem_path))
+                elem_subtree_parent = elem_subtree
+                scope_end = end_offset
+                if elem_filter is not None:
+                    elem_path = elem_path_sub
+            elif offset != end_offset:
+                raise IOError("scope length not reached, something is wrong")
+
+        # close the nested lists which have been read entirely
+        while scope_end is not None and offset >= (scope_end - elem_head_size):
+            if data[offset:offset + elem_head_size] != sentinel_data:
+                raise IOError("failed to read nested block sentinel, "
+                              "expected all bytes to be 0")
+            offset += elem_head_size
+            if offset != scope_end:
+                raise IOError("scope length not reached, something is wrong")
+            elem_subtree_parent, scope_end, elem_path = stack.pop()
+
+        if scope_end is None:
+            return (elem_root[0] if elem_root else _ELEM_SKIP), offset
+
+
+# ----------------------------------------------------------------------------
+# Statistics
+#
+# Functions wrapping the readers to collect ``FBXParseStats``,
+# only used when requested, so parsing without statistics is unaffected.
+
+def stats_array_read(stats, array_read, data_type, array_stride):
+    """
+    Wrap an array reader from ``read_data``, recording the array in ``stats``.
+    """
+    from time import perf_counter
+    prop_bytes = stats.prop_bytes
+
+    def array_read_stats(data, offset, size):
+        length, encoding, comp_len = _struct_array_head.unpack_from(data, offset)
+        prop_bytes[data_type] = prop_bytes.get(data_type, 0) + 12 + comp_len
+        if encoding != 1:
+            return array_read(data, offset, size)
+
+        t = perf_counter()
+        result = array_read(data, offset, size)
+        stats.time_zlib += perf_counter() - t
+        stats.array_count_compressed += 1
+        stats.array_bytes_compressed += comp_len
+        stats.array_bytes_inflated += length * array_stride
+        return result
+
+    return array_read_stats
+
+
+def stats_read_props(stats):
+    """
+    Return ``read_elem_props_from``, adding the time taken to ``stats.time_props``.
+    """
+    from time import perf_counter
+
+    def read_elem_props_from_stats(*args):
+        t = perf_counter()
+        result = read_elem_props_from(*args)
+        stats.time_props += perf_counter() - t
+        return result
+
+    return read_elem_props_from_stats
+
+
+def stats_submit(stats, submit):
+    """
+    Wrap ``submit``, adding the time taken by the workers to ``stats.time_zlib_workers``.
+    """
+    from time import perf_counter
+    import threading
+    lock = threading.Lock()
+
+    def call_timed(func, *args):
+        t = perf_counter()
+        result = func(*args)
+        t = perf_counter() - t
+        with lock:
+            stats.time_zlib_workers += t
+        return result
+
+    return lambda func, *args: submit(call_timed, func, *args)
+
+
+def stats_skip(stats):
+    """
+    Return a function taking the size of an element skipped by ``elem_filter``,
+    subtracting it from ``stats.bytes_read``.
+    """
+    def skip(size):
+        stats.bytes_read -= size
+
+    return skip
+
+
+def stats_count(stats, elem_root):
+    """
+    Count the elements & properties of the tree ``elem_root`` in ``stats``,
+    array sizes are recorded while reading, see: ``stats_array_read``.
+    """
+    elem_count = stats.elem_count
+    prop_count = stats.prop_count
+    prop_bytes = stats.prop_bytes
+    scalar_unpack_dict_get = _scalar_unpack_dict.get
+
+    stack = list(elem_root[3])
+    while stack:
+        elem_id, props, props_type, elems = stack.pop()
+        elem_count[elem_id] = elem_count.get(elem_id, 0) + 1
+        for data_type, value in zip(props_type, props):
+            prop_count[data_type] = prop_count.get(data_type, 0) + 1
+            scalar = scalar_unpack_dict_get(data_type)
+            if scalar is not None:
+                size = scalar[1]
+            elif data_type == 83 or data_type == 82:  # b'S'[0], b'R'[0]
+                size = 4 + len(value)
+            elif data_type == 98:  # b'b'[0]
+                size = len(value)
+            else:
+                continue
+            prop_bytes[data_type] = prop_bytes.get(data_type, 0) + size
+        stack.extend(elems)
+
+
+# ----------------------------------------------------------------------------
+# File Access
+
+def read_elem_props(read, prop_count, prop_length, read_data):
+    # the property list is read at once, then decoded from memory
+    elem_props_data, elem_props_type, offset = read_elem_props_from(
+        read(prop_length), 0, prop_count, prop_length, read_data)
+    if offset != prop_length:
+        raise IOError("property list length not reached, something is wrong")
+    return elem_props_data, elem_props_type
+
+
+def read_elem(read, tell, use_namedtuple, read_data=read_data_dict,
+              elem_filter=None, elem_path=(), seek=None, intern=None, elem_head=_struct_elem_head,
+              read_props=read_elem_props_from):
+    """
+    Read the element at the current file position, including its nested elements.
+
+    Returns None for the NULL record (end of the list), or _ELEM_SKIP
+    when the element is excluded by ``elem_filter``.
+    ``intern`` is used for element ids and strings, see: ``read_elem_props_from``.
+    ``elem_head`` depends on the FBX version, see: ``elem_head_struct``.
+    ``read_props`` decodes property lists, see: ``read_elem_props_from``.
+    """
+    elem_head_unpack = elem_head.unpack
+    elem_head_size = elem_head.size
+    # at the end of each nested block, there is a NUL record to indicate
+    # that the sub-scope exists (i.e. to distinguish between P: and P : {})
+    # this NUL record is the size of the element header (13 bytes, 25 from FBX 7500).
+    sentinel_data = b'\0' * elem_head_size
+
+    # Nested elements are read using an explicit stack instead of recursion,
+    # holding the state of the enclosing nested lists:
+    # (elem_subtree_parent, scope_end, elem_path)
+    stack = []
+    elem_root = elem_subtree_parent = []  # the list elements are added to
+    scope_end = None                      # end offset of the nested list being read
+
+    # the offset is tracked here, instead of calling tell()
+    offset = tell()
+
+    while True:
+        # [0] the offset at which this block ends
+        # [1] the number of properties in the scope
+        # [2] the length of the property list
+        # [3] the length of the elem name
+        end_offset, prop_count, prop_length, elem_id_size = elem_head_unpack(read(elem_head_size))
+        if end_offset == 0:
+            if scope_end is not None:
+                raise IOError("unexpected NULL record, something is wrong")
+            return None
+
+        elem_id = read(elem_id_size)             # elem name of the scope/key
+        offset += elem_head_size + elem_id_size
+        if intern is not None:
+            elem_id = intern(elem_id, elem_id)
+
+        # skip the entire element, without reading its contents
+        if elem_filter is not None:
+            elem_path_sub = elem_path + (elem_id,)
+            if not elem_filter(elem_path_sub):
+                seek(end_offset)
+                offset = end_offset
+                elem_id = None
+
+        if elem_id is not None:
+            # see: read_elem_props
+            elem_props_data, elem_props_type, props_offset = read_props(
+                read(prop_length), 0, prop_count, prop_length, read_data, intern)
+            if props_offset != prop_length:
+                raise IOError("property list length not reached, something is wrong")
+            offset += prop_length
+            elem_subtree = []                    # elem children (if any)
+
+            args = (elem_id, elem_props_data, elem_props_type, elem_subtree)
+            elem_subtree_parent.append(FBXElem(*args) if use_namedtuple else args)
+
+            if offset < end_offset:
+                stack.append((elem_subtree_parent, scope_end, elem_path))
+                elem_subtree_parent = elem_subtree
+                scope_end = end_offset
+                if elem_filter is not None:
+                    elem_path = elem_path_sub
+            elif offset != end_offset:
+                raise IOError("scope length not reached, something is wrong")
+
+        # close the nested lists which have been read entirely
+        while scope_end is not None and offset >= (scope_end - elem_head_size):
+            if read(elem_head_size) != sentinel_data:
+                raise IOError("failed to read nested block sentinel, "
+                              "expected all bytes to be 0")
+            offset += elem_head_size
+            if offset != scope_end:
+                raise IOError("scope length not reached, something is wrong")
+            elem_subtree_parent, scope_end, elem_path = stack.pop()
+
+        if scope_end is None:
+            return elem_root[0] if elem_root else _ELEM_SKIP
+
+
+def read_elem_events(f, read_data, elem_filter, elem_head=_struct_elem_head):
+    """
+    Generator reading elements from the file ``f`` (positioned after the header),
+    see: ``parse_events``.
+    """
+    read = f.read
+    tell = f.tell
+    seek = f.seek
+
+    elem_head_unpack = elem_head.unpack
+    elem_head_size = elem_head.size
+    sentinel_data = b'\0' * elem_head_size
+
+    # elements which have a nested list that hasn't been read yet,
+    # (elem_id, elem_props_data, elem_props_type, offset, end_offset)
+    stack = []
+
+    with f:
+        while True:
+            if stack and tell() == stack[-1][4] - elem_head_size:
+                elem_id, elem_props_data, elem_props_type, offset, end_offset = stack.pop()
+                if read(elem_head_size) != sentinel_data:
+                    raise IOError("failed to read nested block sentinel, "
+                                  "expected all bytes to be 0")
+                yield ("end", elem_id, elem_props_data, elem_props_type, len(stack), offset)
+                continue
+
+            offset = tell()
+            end_offset, prop_count, prop_length, elem_id_size = elem_head_unpack(read(elem_head_size))
+            if end_offset == 0:
+                if stack:
+                    raise IOError("unexpected NULL record, something is wrong")
+                break
 
-    if tell() < end_offset:
-        while tell() < (end_offset - _BLOCK_SENTINEL_LENGTH):
-            elem_subtree.append(read_elem(read, tell, use_namedtuple))
+            elem_id = read(elem_id_size)
 
-        if read(_BLOCK_SENTINEL_LENGTH) != _BLOCK_SENTINEL_DATA:
-            raise IOError("failed to read nested block sentinel, "
-                          "expected all bytes to be 0")
+            if elem_filter is not None:
+                if not elem_filter(tuple(item[0] for item in stack) + (elem_id,)):
+                    seek(end_offset)
+                    continue
 
-    if tell() != end_offset:
-        raise IOError("scope length not reached, something is wrong")
+            elem_props_data, elem_props_type = read_elem_props(read, prop_count, prop_length, read_data)
+            depth = len(stack)
 
-    args = (elem_id, elem_props_data, elem_props_type, elem_subtree)
-    return FBXElem(*args) if use_namedtuple else args
+            yield ("start", elem_id, elem_props_data, elem_props_type, depth, offset)
 
+            if tell() < end_offset:
+                stack.append((elem_id, elem_props_data, elem_props_type, offset, end_offset))
+            elif tell() != end_offset:
+                raise IOError("scope length not reached, something is wrong")
+            else:
+                yield ("end", elem_id, elem_props_data, elem_props_type, depth, offset)
 
-def parse(fn, use_namedtuple=True):
-    # import time
-    # t = time.time()
 
-    root_elems = []
+def parse_events(fn, lazy_arrays=False, elem_filter=None):
+    """
+    Incremental alternative to ``parse``, which doesn't hold the element tree in memory.
 
-    with open(fn, 'rb') as f:
-        read = f.read
-        tell = f.tell
+    Returns an iterator and the FBX version,
+    the iterator yields ``(event, id, props, props_type, depth, offset)`` tuples,
+    where ``event`` is ``"start"`` when an element has been read
+    and ``"end"`` once its nested elements (if any) have been read too,
+    both events pass the same element values.
+    ``offset`` is the position of the element in the file.
 
-        HEAD_MAGIC = b'Kaydara FBX Binary\x20\x20\x00\x1a\x00'
-        if read(len(HEAD_MAGIC)) != HEAD_MAGIC:
+    The file is read as the iterator advances,
+    stopping early (``break`` or ``close()``) closes the file.
+    ``lazy_arrays`` and ``elem_filter`` are the same as for ``parse``.
+    """
+    f = open(fn, 'rb')
+    try:
+        read = f.read
+        if read(len(_HEAD_MAGIC)) != _HEAD_MAGIC:
             raise IOError("Invalid header")
-
         fbx_version = read_uint(read)
+    except:
+        f.close()
+        raise
+
+    read_data = read_data_dict_lazy if lazy_arrays else read_data_dict
+    return read_elem_events(f, read_data, elem_filter, elem_head_struct(fbx_version)), fbx_version
+
+
+def parse_file(f, root_elems, use_namedtuple, read_data, elem_filter, intern, read_props, skip=None):
+    read = f.read
+    tell = f.tell
+    seek = f.seek
+    if skip is not None:
+        # 'seek' is only used to skip elements
+        def seek(offset, seek=seek):
+            skip(offset - tell())
+            seek(offset)
+
+    if read(len(_HEAD_MAGIC)) != _HEAD_MAGIC:
+        raise IOError("Invalid header")
+
+    fbx_version = read_uint(read)
+    elem_head = elem_head_struct(fbx_version)
+
+    while True:
+        elem = read_elem(read, tell, use_namedtuple, read_data,
+                         elem_filter, (), seek, intern, elem_head, read_props)
+        if elem is None:
+            break
+        if elem is not _ELEM_SKIP:
+            root_elems.append(elem)
 
-        while True:
-            elem = read_elem(read, tell, use_namedtuple)
-            if elem is None:
-                break
+    return fbx_version
+
+
+def parse_mmap(f, root_elems, use_namedtuple, read_data, elem_filter, intern, read_props, skip=None):
+    import mmap
+
+    # the mapping stays open as long as any view into it is referenced,
+    # closing the file object doesn't unmap it.
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if data[:len(_HEAD_MAGIC)] != _HEAD_MAGIC:
+        raise IOError("Invalid header")
+
+    fbx_version, offset = read_uint_from(data, len(_HEAD_MAGIC))
+    elem_head = elem_head_struct(fbx_version)
+
+    while True:
+        elem, offset = read_elem_from(data, offset, use_namedtuple, read_data,
+                                      elem_filter, (), intern, elem_head, read_props, skip)
+        if elem is None:
+            break
+        if elem is not _ELEM_SKIP:
             root_elems.append(elem)
 
-    # print("done in %.4f sec" % (time.time() - t))
+    return fbx_version
+
+
+def parse(fn, use_namedtuple=True, use_mmap=False, lazy_arrays=False, elem_filter=None,
+          executor=None, array_backend='array', intern_strings=True, stats=None):
+    """
+    Parse the binary FBX file ``fn``,
+    returning the root element and the FBX version.
+
+    When ``use_mmap`` is enabled, the file is memory-mapped and walked in place,
+    ``R`` (bytes) properties and uncompressed arrays are returned as
+    memoryviews into the mapping instead of ``bytes`` / ``array.array`` copies.
+    The mapping is released once no more views reference it.
+
+    When ``lazy_arrays`` is enabled, compressed arrays are returned as
+    ``FBXLazyArray`` objects which are only inflated on first access.
+
+    ``elem_filter`` is an optional function, taking a tuple of element ids
+    (the path from the top-level element to the element being read),
+    returning False to skip the element entirely.
+    Skipped elements aren't decoded, the reader jumps directly to their end offset.
+    See ``path_filter`` for matching elements by path.
+
+    ``executor`` inflates compressed arrays in parallel,
+    either a ``concurrent.futures.ThreadPoolExecutor`` or a number of worker threads.
+    Arrays are handed to the workers as they're found (zlib releases the GIL),
+    all of them are filled in before returning. Ignored when ``lazy_arrays`` is enabled.
+
+    ``array_backend`` selects the type of array properties,
+    ``'array'`` for ``array.array`` or ``'numpy'`` for little-endian NumPy arrays
+    (``<f4``, ``<i4``, ``<f8``, ``<i8``). Uncompressed arrays are views
+    into the read buffer (or the mapping, see ``use_mmap``), compressed arrays view the inflated data.
+    All NumPy arrays are read-only, copy them to make changes.
+    NumPy is only imported when used, it can't be combined with ``lazy_arrays``.
+
+    When ``intern_strings`` is enabled, repeated element ids and ``S`` (string) properties
+    share a single ``bytes`` instance (for the duration of the parse).
+
+    ``stats`` is an optional ``FBXParseStats``, filled in with the number of elements & properties,
+    array sizes, the bytes read (excluding elements skipped by ``elem_filter``)
+    and the time spent on each part of parsing.
+    """
+    root_elems = []
+
+    if array_backend != 'array' and lazy_arrays:
+        raise ValueError("lazy_arrays can't be used with the %r array backend" % array_backend)
+
+    intern = {}.setdefault if intern_strings else None
+
+    futures = None
+    executor_owned = None
+    if executor is not None and not lazy_arrays:
+        if isinstance(executor, int):
+            from concurrent.futures import ThreadPoolExecutor
+            executor = executor_owned = ThreadPoolExecutor(max_workers=executor)
+        futures = []
+        futures_append = futures.append
+        executor_submit = executor.submit
+
+        def submit(*args):
+            futures_append(executor_submit(*args))
+    else:
+        submit = None
+
+    read_props = read_elem_props_from
+    skip = None
+    if stats is not None:
+        from time import perf_counter
+        import os
+        time_start = perf_counter()
+        read_props = stats_read_props(stats)
+        if elem_filter is not None:
+            skip = stats_skip(stats)
+        if submit is not None:
+            submit = stats_submit(stats, submit)
+
+    try:
+        with open(fn, 'rb') as f:
+            if futures is not None or array_backend != 'array' or stats is not None:
+                read_data = read_data_dict_create(
+                    lazy=lazy_arrays, view=use_mmap, submit=submit, array_backend=array_backend, stats=stats)
+            elif use_mmap:
+                read_data = read_data_dict_view_lazy if lazy_arrays else read_data_dict_view
+            else:
+                read_data = read_data_dict_lazy if lazy_arrays else read_data_dict
+
+            parse_fn = parse_mmap if use_mmap else parse_file
+            fbx_version = parse_fn(f, root_elems, use_namedtuple, read_data, elem_filter, intern, read_props, skip)
+
+        if futures is not None:
+            # raises any error from the workers
+            for future in futures:
+                future.result()
+    finally:
+        if executor_owned is not None:
+            executor_owned.shutdown(wait=True)
 
     args = (b'', [], bytearray(0), root_elems)
-    return FBXElem(*args) if use_namedtuple else args, fbx_version
+    elem_root = FBXElem(*args) if use_namedtuple else args
+
+    if stats is not None:
+        stats.time_total += perf_counter() - time_start
+        file_size = os.path.getsize(fn)
+        stats.file_size += file_size
+        stats.bytes_read += file_size
+        stats_count(stats, elem_root)
+
+    return elem_root, fbx_version
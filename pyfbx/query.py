@@ -0,0 +1,170 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Lookups in a parsed element tree.
+
+Instead of scanning the nested elements on each lookup,
+the nested elements of each element are indexed by id (on first access),
+as are the ``P`` records of ``Properties70`` elements by property name.
+"""
+
+__all__ = (
+    "FBXQuery",
+    )
+
+import re
+
+# 'Id', 'Id[*]', 'Id[2]' or '*'
+_path_item_re = re.compile(br'^([^\[\]]+)(?:\[(\*|-?\d+)\])?$')
+
+
+def path_split(path):
+    """
+    Split a path such as ``"Objects/Geometry[*]/Vertices"``
+    into a tuple of (id, selector) pairs, see: ``FBXQuery.find_path``.
+    The id is None for ``*`` (any id), the selector is None for all matching elements,
+    otherwise the index of the matching element.
+    """
+    if isinstance(path, str):
+        path = path.encode('utf-8')
+
+    pattern = []
+    for item in path.strip(b'/').split(b'/'):
+        match = _path_item_re.match(item)
+        if match is None:
+            raise ValueError("invalid path item %r" % item.decode('utf-8', 'replace'))
+        elem_id, selector = match.groups()
+        if elem_id == b'*':
+            elem_id = None
+            if selector is None:
+                selector = b'*'
+        elif selector is None:
+            selector = b'0'
+        pattern.append((elem_id, None if selector == b'*' else int(selector)))
+    return tuple(pattern)
+
+
+class FBXQuery:
+    """
+    Lookups in the element tree ``elem_root`` (from ``parse_bin.parse``, ``parse_ascii.parse``
+    or ``store_bin.parse``), the elements must have ``id`` and ``elems`` attributes.
+
+    Indices are built for each element once it's first looked up in,
+    the tree must not be modified while the query is in use.
+    Lists returned are shared with the indices, they must not be modified either.
+    """
+    __slots__ = (
+        "elem_root",
+        # id(elem): (elem, {id: [elems]})
+        "_elems_index",
+        # id(elem): (elem, {prop_id: elem})
+        "_props_index",
+        # path: pattern, see: path_split
+        "_path_cache",
+        )
+
+    def __init__(self, elem_root):
+        self.elem_root = elem_root
+        self._elems_index = {}
+        self._props_index = {}
+        self._path_cache = {}
+
+    def elems_index(self, elem):
+        """
+        Return a dictionary of the nested elements of ``elem``,
+        a list of elements (in file order) for each id.
+        """
+        # elements are kept in the index, so their id() isn't reused
+        index = self._elems_index.get(id(elem))
+        if index is None:
+            elems_by_id = {}
+            for elem_sub in elem.elems:
+                elems_sub = elems_by_id.get(elem_sub.id)
+                if elems_sub is None:
+                    elems_by_id[elem_sub.id] = [elem_sub]
+                else:
+                    elems_sub.append(elem_sub)
+            index = self._elems_index[id(elem)] = (elem, elems_by_id)
+        return index[1]
+
+    def find_first(self, elem, elem_id):
+        """
+        Return the first element of ``elem`` with ``elem_id``, or None.
+        """
+        elems = self.elems_index(elem).get(elem_id)
+        return elems[0] if elems else None
+
+    def find_all(self, elem, elem_id):
+        """
+        Return all elements of ``elem`` with ``elem_id``.
+        """
+        return self.elems_index(elem).get(elem_id, ())
+
+    def props_index(self, elem):
+        """
+        Return a dictionary of the ``P`` records of the ``Properties70`` element ``elem``
+        by property name (the first record is used when a name is repeated).
+        """
+        index = self._props_index.get(id(elem))
+        if index is None:
+            props_by_id = {}
+            for elem_prop in elem.elems:
+                assert(elem_prop.id == b'P')
+                props_by_id.setdefault(elem_prop.props[0], elem_prop)
+            index = self._props_index[id(elem)] = (elem, props_by_id)
+        return index[1]
+
+    def props_find_first(self, elem, prop_id):
+        """
+        Return the ``P`` record named ``prop_id`` of the ``Properties70`` element ``elem``, or None.
+        """
+        return self.props_index(elem).get(prop_id)
+
+    def find_path(self, path, elem=None):
+        """
+        Return the elements matching ``path`` (starting from ``elem``, by default the root).
+
+        Each item of the path is an element id, which matches the first element with that id,
+        ``Id[n]`` the n'th element with that id, ``Id[*]`` all elements with that id
+        and ``*`` all elements, e.g. ``"Objects/Geometry[*]/Vertices"``.
+        """
+        pattern = self._path_cache.get(path)
+        if pattern is None:
+            pattern = self._path_cache[path] = path_split(path)
+
+        elems = [self.elem_root if elem is None else elem]
+        for elem_id, selector in pattern:
+            elems_found = []
+            for elem in elems:
+                elems_sub = elem.elems if elem_id is None else self.elems_index(elem).get(elem_id, ())
+                if selector is None:
+                    elems_found.extend(elems_sub)
+                elif -len(elems_sub) <= selector < len(elems_sub):
+                    elems_found.append(elems_sub[selector])
+            elems = elems_found
+        return elems
+
+    def find_path_first(self, path, elem=None):
+        """
+        Return the first element matching ``path`` or None, see: ``find_path``.
+        """
+        elems = self.find_path(path, elem)
+        return elems[0] if elems else None
@@ -0,0 +1,145 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Object graph of a parsed element tree,
+the ``Objects`` (by UUID) and the ``Connections`` between them.
+"""
+
+__all__ = (
+    "FBXScene",
+    "FBXConnection",
+    )
+
+from . import query
+
+from collections import namedtuple
+# type: the connection type, b'OO' (object to object) or b'OP' (object to property).
+# src, dst: the UUIDs of the objects connected, 'src' is connected to 'dst'.
+# prop: the property of 'dst' for b'OP' connections, otherwise None.
+# elem: the 'C' element.
+FBXConnection = namedtuple("FBXConnection", ("type", "src", "dst", "prop", "elem"))
+del namedtuple
+
+_CONNECTION_TYPES = {b'OO', b'OP'}
+
+
+class FBXScene:
+    """
+    Objects and connections of the element tree ``elem_root``,
+    (from ``parse_bin.parse``, ``parse_ascii.parse`` or ``store_bin.parse``).
+    ``fbx_query`` is the ``query.FBXQuery`` of ``elem_root`` to use, when the caller has one.
+
+    Objects are keyed by their first property, the UUID (or the name in files before FBX 7).
+    Connections are indexed in both directions by the id of the object at the other end
+    (``b'Model'``, ``b'Geometry'`` ... etc), None when it isn't in ``Objects`` (the root for e.g.).
+
+    Lists returned are shared with the indices, they must not be modified.
+    """
+    __slots__ = (
+        # uuid: elem
+        "objects",
+        # elem_id: [elem]
+        "objects_by_type",
+        # [FBXConnection], all 'C' elements in file order
+        "connections",
+        # uuid: {elem_id: [(elem, FBXConnection)]}, see: forward & reverse
+        "_forward",
+        "_reverse",
+        )
+
+    def __init__(self, elem_root, fbx_query=None):
+        self.objects = objects = {}
+        self.objects_by_type = objects_by_type = {}
+        self.connections = connections = []
+        self._forward = forward = {}
+        self._reverse = reverse = {}
+
+        if fbx_query is None:
+            fbx_query = query.FBXQuery(elem_root)
+
+        fbx_objects = fbx_query.find_first(elem_root, b'Objects')
+        if fbx_objects is not None:
+            for fbx_obj in fbx_objects.elems:
+                if not fbx_obj.props:
+                    continue
+                objects[fbx_obj.props[0]] = fbx_obj
+                objects_by_type.setdefault(fbx_obj.id, []).append(fbx_obj)
+
+        fbx_connections = fbx_query.find_first(elem_root, b'Connections')
+        if fbx_connections is None:
+            return
+
+        objects_get = objects.get
+        for fbx_link in fbx_connections.elems:
+            props = fbx_link.props
+            c_type = props[0]
+            if c_type not in _CONNECTION_TYPES:
+                # b'PO' & b'PP' (property to object/property) aren't indexed
+                connections.append(FBXConnection(c_type, None, None, None, fbx_link))
+                continue
+
+            c_src, c_dst = props[1:3]
+            c_prop = props[3] if c_type == b'OP' and len(props) > 3 else None
+            connection = FBXConnection(c_type, c_src, c_dst, c_prop, fbx_link)
+            connections.append(connection)
+
+            fbx_src = objects_get(c_src)
+            fbx_dst = objects_get(c_dst)
+            forward.setdefault(c_src, {}).setdefault(
+                fbx_dst.id if fbx_dst is not None else None, []).append((fbx_dst, connection))
+            reverse.setdefault(c_dst, {}).setdefault(
+                fbx_src.id if fbx_src is not None else None, []).append((fbx_src, connection))
+
+    def object(self, uuid):
+        """
+        Return the object element with ``uuid``, or None.
+        """
+        return self.objects.get(uuid)
+
+    def forward(self, uuid, elem_id):
+        """
+        Return the objects with ``elem_id`` which ``uuid`` is connected to (where it's the source),
+        as (elem, FBXConnection) pairs in file order.
+        """
+        objects_by_type = self._forward.get(uuid)
+        return objects_by_type.get(elem_id, ()) if objects_by_type is not None else ()
+
+    def reverse(self, uuid, elem_id):
+        """
+        Return the objects with ``elem_id`` connected to ``uuid`` (where it's the destination),
+        as (elem, FBXConnection) pairs in file order.
+        """
+        objects_by_type = self._reverse.get(uuid)
+        return objects_by_type.get(elem_id, ()) if objects_by_type is not None else ()
+
+    def forward_types(self, uuid):
+        """
+        Return the ids of the objects ``uuid`` is connected to.
+        """
+        objects_by_type = self._forward.get(uuid)
+        return objects_by_type.keys() if objects_by_type is not None else ()
+
+    def reverse_types(self, uuid):
+        """
+        Return the ids of the objects connected to ``uuid``.
+        """
+        objects_by_type = self._reverse.get(uuid)
+        return objects_by_type.keys() if objects_by_type is not None else ()
@@ -0,0 +1,294 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Compact node store for binary FBX files.
+
+Instead of a tree of ``FBXElem`` tuples, the hierarchy is kept in a flat table
+of parallel arrays (one row per element), properties are decoded from the file
+buffer when accessed. ``FBXElemView`` objects expose the same
+``id``, ``props``, ``props_type`` & ``elems`` attributes as ``FBXElem``.
+"""
+
+__all__ = (
+    "parse",
+    "FBXNodeStore",
+    "FBXElemView",
+    )
+
+from collections import OrderedDict
+import array
+
+from . import parse_bin
+
+# number of rows whose decoded properties are kept, see: FBXNodeStore.props
+_PROPS_CACHE_SIZE = 1024
+
+
+class FBXNodeStore:
+    """
+    Table of all elements in a file, row 0 is the (empty) root element.
+    Links are row indices, -1 when there is none.
+    """
+    __slots__ = (
+        "data",
+        "read_data",
+        # distinct element ids, referenced by 'id_index'
+        "ids",
+        "id_index",
+        "parent",
+        "first_child",
+        "next_sibling",
+        "props_offset",
+        "prop_count",
+        "prop_length",
+        # row: (props, props_type), the most recently decoded rows
+        "_props_cache",
+        "_props_cache_size",
+        )
+
+    def __init__(self, data, read_data, props_cache_size=_PROPS_CACHE_SIZE):
+        self.data = data
+        self.read_data = read_data
+        self._props_cache = OrderedDict()
+        self._props_cache_size = props_cache_size
+        self.ids = [b'']
+        self.id_index = array.array('I', (0,))
+        self.parent = array.array('i', (-1,))
+        self.first_child = array.array('i', (-1,))
+        self.next_sibling = array.array('i', (-1,))
+        self.props_offset = array.array('Q', (0,))
+        self.prop_count = array.array('I', (0,))
+        self.prop_length = array.array('I', (0,))
+
+    def __len__(self):
+        return len(self.parent)
+
+    def view(self, index=0):
+        return FBXElemView(self, index)
+
+    def props(self, index):
+        """
+        Decode the properties of row ``index``, returning (props, props_type).
+
+        The most recently decoded rows are kept (up to ``props_cache_size``),
+        so reading an element's properties repeatedly doesn't decode them each time.
+        """
+        props_cache = self._props_cache
+        result = props_cache.get(index)
+        if result is not None:
+            props_cache.move_to_end(index)
+            return result
+
+        props, props_type, offset = parse_bin.read_elem_props_from(
+            self.data, self.props_offset[index], self.prop_count[index], self.prop_length[index],
+            self.read_data)
+        result = props, props_type
+        if self._props_cache_size > 0:
+            props_cache[index] = result
+            if len(props_cache) > self._props_cache_size:
+                props_cache.popitem(last=False)
+        return result
+
+    def children(self, index):
+        next_sibling = self.next_sibling
+        child = self.first_child[index]
+        while child != -1:
+            yield child
+            child = next_sibling[child]
+
+
+class FBXElemView:
+    """
+    A row of an ``FBXNodeStore``, compatible with ``FBXElem``.
+
+    Views are created on access, compare them with ``==`` rather than ``is``.
+    Properties are decoded by the store (see ``FBXNodeStore.props``),
+    the lists returned may be shared, they must not be modified.
+    """
+    __slots__ = (
+        "_store",
+        "_index",
+        )
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    @property
+    def id(self):
+        store = self._store
+        return store.ids[store.id_index[self._index]]
+
+    @property
+    def props(self):
+        return self._store.props(self._index)[0]
+
+    @property
+    def props_type(self):
+        return self._store.props(self._index)[1]
+
+    @property
+    def elems(self):
+        store = self._store
+        return [FBXElemView(store, child) for child in store.children(self._index)]
+
+    @property
+    def parent(self):
+        parent = self._store.parent[self._index]
+        return None if parent == -1 else FBXElemView(self._store, parent)
+
+    # tuple compatibility, (id, props, props_type, elems)
+    def __len__(self):
+        return 4
+
+    def __iter__(self):
+        props, props_type = self._store.props(self._index)
+        return iter((self.id, props, props_type, self.elems))
+
+    def __getitem__(self, key):
+        return tuple(self)[key]
+
+    def __eq__(self, other):
+        if type(other) is FBXElemView:
+            return self._store is other._store and self._index == other._index
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((id(self._store), self._index))
+
+    def __repr__(self):
+        return "FBXElemView(%r, <row %d>)" % (self.id, self._index)
+
+
+# ----------------------------------------------------------------------------
+# Build
+
+def store_build(store):
+    """
+    Fill ``store`` from the elements in its buffer,
+    only element headers are read, properties are skipped.
+    Returns the FBX version.
+    """
+    data = store.data
+
+    ids = store.ids
+    ids_lookup = {elem_id: i for i, elem_id in enumerate(ids)}
+    id_index_append = store.id_index.append
+    parent_append = store.parent.append
+    first_child = store.first_child
+    first_child_append = first_child.append
+    next_sibling = store.next_sibling
+    next_sibling_append = next_sibling.append
+    props_offset_append = store.props_offset.append
+    prop_count_append = store.prop_count.append
+    prop_length_append = store.prop_length.append
+
+    if data[:len(parse_bin._HEAD_MAGIC)] != parse_bin._HEAD_MAGIC:
+        raise IOError("Invalid header")
+    fbx_version, offset = parse_bin.read_uint_from(data, len(parse_bin._HEAD_MAGIC))
+
+    elem_head = parse_bin.elem_head_struct(fbx_version)
+    unpack_elem_head = elem_head.unpack_from
+    elem_head_size = elem_head.size
+    sentinel_data = b'\0' * elem_head_size
+
+    # (parent, last child, scope_end) of the enclosing elements
+    stack = []
+    parent = 0
+    child_last = -1
+    scope_end = None
+    index = 0
+
+    while True:
+        end_offset, prop_count, prop_length, elem_id_size = unpack_elem_head(data, offset)
+        if end_offset == 0:
+            if scope_end is not None:
+                raise IOError("unexpected NULL record, something is wrong")
+            break
+
+        offset += elem_head_size
+        elem_id = data[offset:offset + elem_id_size]
+        offset += elem_id_size
+
+        id_index = ids_lookup.get(elem_id)
+        if id_index is None:
+            id_index = ids_lookup[elem_id] = len(ids)
+            ids.append(elem_id)
+
+        index += 1
+        id_index_append(id_index)
+        parent_append(parent)
+        first_child_append(-1)
+        next_sibling_append(-1)
+        props_offset_append(offset)
+        prop_count_append(prop_count)
+        prop_length_append(prop_length)
+
+        if child_last == -1:
+            first_child[parent] = index
+        else:
+            next_sibling[child_last] = index
+        child_last = index
+
+        offset += prop_length
+        if offset < end_offset:
+            stack.append((parent, child_last, scope_end))
+            parent = index
+            child_last = -1
+            scope_end = end_offset
+        elif offset != end_offset:
+            raise IOError("scope length not reached, something is wrong")
+
+        # close the nested lists which have been read entirely
+        while scope_end is not None and offset >= (scope_end - elem_head_size):
+            if data[offset:offset + elem_head_size] != sentinel_data:
+                raise IOError("failed to read nested block sentinel, "
+                              "expected all bytes to be 0")
+            offset += elem_head_size
+            if offset != scope_end:
+                raise IOError("scope length not reached, something is wrong")
+            parent, child_last, scope_end = stack.pop()
+
+    return fbx_version
+
+
+def parse(fn, use_mmap=True, lazy_arrays=False, props_cache_size=_PROPS_CACHE_SIZE):
+    """
+    Parse the binary FBX file ``fn`` into an ``FBXNodeStore``,
+    returning the root ``FBXElemView`` and the FBX version.
+
+    The file is kept in memory (memory-mapped when ``use_mmap`` is enabled)
+    and properties are decoded when they're accessed, only the properties of
+    the last ``props_cache_size`` elements accessed are kept (0 to decode on every access).
+    ``use_mmap`` and ``lazy_arrays`` are as for ``parse_bin.parse``.
+    """
+    with open(fn, 'rb') as f:
+        if use_mmap:
+            import mmap
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            read_data = parse_bin.read_data_dict_view_lazy if lazy_arrays else parse_bin.read_data_dict_view
+        else:
+            data = f.read()
+            read_data = parse_bin.read_data_dict_lazy if lazy_arrays else parse_bin.read_data_dict
+
+    store = FBXNodeStore(data, read_data, props_cache_size)
+    fbx_version = store_build(store)
+    return store.view(0), fbx_version
@@ -0,0 +1,309 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Writer for binary FBX files, the inverse of ``parse_bin.parse``.
+"""
+
+__all__ = (
+    "write",
+    )
+
+from struct import Struct
+import array
+import zlib
+
+from . import parse_bin
+
+# arrays smaller than this (in bytes) are written uncompressed
+_COMPRESS_MIN_SIZE = 128
+# arrays smaller than this (in bytes) are compressed immediately,
+# instead of handing them to a worker.
+_ARRAY_SUBMIT_MIN_SIZE = 1 << 16
+# when compressing on workers, encode up to this many elements (or arrays handed to workers)
+# ahead of the element being written
+_ENCODE_AHEAD_ELEMS = 1 << 12
+_ENCODE_AHEAD_ARRAYS = 1 << 5
+# output is collected into writes of at least this size (in bytes)
+_WRITE_BUFFER_SIZE = 1 << 20
+
+# Elements which are written with a NUL record (block sentinel) even without nested elements,
+# as the FBX SDK expects (as well as elements with no properties, see: write).
+_ELEMS_ID_ALWAYS_BLOCK_SENTINEL = {b'AnimationStack', b'AnimationLayer'}
+
+_FOOT_ID = b'\xfa\xbc\xab\x09\xd0\xc8\xd4\x66\xb1\x76\xfb\x83\x1c\xf7\x26\x7e'
+_FOOT_MAGIC = b'\xf8\x5a\x8c\x6a\xde\xf5\xd9\x7e\xec\xe9\x0c\xe3\x75\x8f\x29\x0b'
+
+_struct_uint = Struct(b'<I')
+_struct_uint64 = Struct(b'<Q')
+_struct_array_head = Struct(b'<3I')
+
+# fixed size property types
+_scalar_pack_dict = {
+    b'Y'[0]: Struct(b'<h').pack,  # 16 bit int
+    b'C'[0]: Struct(b'?').pack,   # 1 bit bool (yes/no)
+    b'I'[0]: Struct(b'<i').pack,  # 32 bit int
+    b'F'[0]: Struct(b'<f').pack,  # 32 bit float
+    b'D'[0]: Struct(b'<d').pack,  # 64 bit float
+    b'L'[0]: Struct(b'<q').pack,  # 64 bit int
+    }
+
+# array property types, (array type, stride, byteswap)
+_array_type_dict = {
+    b'f'[0]: ('f', 4, False),  # array (float)
+    b'i'[0]: ('i', 4, True),   # array (int)
+    b'd'[0]: ('d', 8, False),  # array (double)
+    b'l'[0]: ('q', 8, True),   # array (long)
+    }
+
+
+# ----------------------------------------------------------------------------
+# Property Encoding
+
+def array_as_bytes(value, array_type, array_stride, array_byteswap):
+    """
+    Return the little-endian data of an array property, which may be an ``array.array``,
+    ``FBXLazyArray``, memoryview, NumPy array or a sequence of numbers.
+    """
+    if type(value) is parse_bin.FBXLazyArray:
+        value = value.inflate()
+
+    if type(value) is array.array:
+        if array_byteswap and parse_bin._IS_BIG_ENDIAN:
+            value = array.array(value.typecode, value)
+            value.byteswap()
+        data = memoryview(value).cast('B')
+    else:
+        try:
+            data = memoryview(value)
+        except TypeError:
+            data = None
+        if data is not None and data.itemsize == array_stride and data.contiguous:
+            data = data.cast('B')
+        else:
+            return array_as_bytes(array.array(array_type, value), array_type, array_stride, array_byteswap)
+
+    assert(len(data) % array_stride == 0)
+    return data
+
+
+def array_compress(data_type, length, data, level):
+    data = zlib.compress(data, level)
+    return bytes((data_type,)) + _struct_array_head.pack(length, 1, len(data)) + data
+
+
+def elem_props_encode(elem_id, props, props_type, compress_level, compress_min_size, submit):
+    """
+    Encode the property list of an element,
+    returning a list of ``bytes`` and (when ``submit`` is given) futures of ``bytes``.
+    """
+    chunks = []
+    chunks_append = chunks.append
+
+    for data_type, value in zip(props_type, props):
+        pack = _scalar_pack_dict.get(data_type)
+        if pack is not None:
+            chunks_append(bytes((data_type,)) + pack(value))
+        elif data_type == 83 or data_type == 82:  # b'S'[0], b'R'[0]
+            chunks_append(bytes((data_type,)) + _struct_uint.pack(len(value)) + bytes(value))
+        elif data_type == 98:  # b'b'[0]
+            chunks_append(bytes((data_type,)) + bytes(value))
+        else:
+            array_info = _array_type_dict.get(data_type)
+            if array_info is None:
+                raise IOError("unknown property type %r" % chr(data_type))
+            array_type, array_stride, array_byteswap = array_info
+            data = array_as_bytes(value, array_type, array_stride, array_byteswap)
+            length = len(data) // array_stride
+
+            level = compress_level(elem_id, value) if callable(compress_level) else compress_level
+            if level is None or len(data) < compress_min_size:
+                chunks_append(bytes((data_type,)) + _struct_array_head.pack(length, 0, len(data)))
+                chunks_append(bytes(data))
+            elif submit is not None and len(data) >= _ARRAY_SUBMIT_MIN_SIZE:
+                # compressed by a worker, while the remaining elements are encoded
+                chunks_append(submit(array_compress, data_type, length, data, level))
+            else:
+                chunks_append(array_compress(data_type, length, data, level))
+
+    return chunks
+
+
+def elems_props_encode(elem_root, compress_level, compress_min_size, submit):
+    """
+    Generator of the encoded property lists (see ``elem_props_encode``)
+    of all elements of ``elem_root``, in the order they're written.
+    """
+    stack = [iter(elem_root[3])]
+    while stack:
+        elem = next(stack[-1], None)
+        if elem is None:
+            stack.pop()
+            continue
+        elem_id, props, props_type, elems = elem
+        yield elem_props_encode(elem_id, props, props_type, compress_level, compress_min_size, submit)
+        if elems:
+            stack.append(iter(elems))
+
+
+# ----------------------------------------------------------------------------
+# File Access
+
+def write(fn, elem_root, fbx_version=7400, compress_level=1, compress_min_size=_COMPRESS_MIN_SIZE,
+          executor=None):
+    """
+    Write the element tree ``elem_root`` (as returned by ``parse_bin.parse``)
+    to the binary FBX file ``fn``.
+
+    Element headers are 64-bit when ``fbx_version`` is 7500 or later.
+
+    ``compress_level`` is the zlib level used for arrays (None for no compression),
+    or a function taking the element id and the array, returning the level.
+    Arrays smaller than ``compress_min_size`` bytes are written uncompressed.
+
+    ``executor`` compresses large arrays in parallel,
+    either a ``concurrent.futures.ThreadPoolExecutor`` or a number of worker threads.
+
+    The file is written as elements are encoded, only the elements encoded ahead
+    (while workers compress their arrays) are held in memory, not the whole file.
+    """
+    elem_head = parse_bin.elem_head_struct(fbx_version)
+    elem_head_size = elem_head.size
+    elem_end_struct = _struct_uint64 if elem_head_size == 25 else _struct_uint
+    elem_end_pack = elem_end_struct.pack
+    elem_end_pack_into = elem_end_struct.pack_into
+
+    executor_owned = None
+    submit = None
+    if executor is not None:
+        if isinstance(executor, int):
+            from concurrent.futures import ThreadPoolExecutor
+            executor = executor_owned = ThreadPoolExecutor(max_workers=executor)
+        submit = executor.submit
+
+    with open(fn, 'wb') as f:
+        # Output not yet written to the file, starting at 'data_offset',
+        # so most end offsets are filled in before writing (instead of seeking back).
+        data = bytearray(parse_bin._HEAD_MAGIC)
+        data += _struct_uint.pack(fbx_version)
+        data_offset = 0
+
+        def data_flush():
+            nonlocal data_offset
+            f.write(data)
+            data_offset += len(data)
+            data.clear()
+
+        def elem_end_write(elem_offset, end_offset):
+            if elem_offset >= data_offset:
+                elem_end_pack_into(data, elem_offset - data_offset, end_offset)
+            else:
+                f.seek(elem_offset)
+                f.write(elem_end_pack(end_offset))
+                f.seek(data_offset)
+
+        try:
+            props_encoded = elems_props_encode(elem_root, compress_level, compress_min_size, submit)
+            if submit is not None:
+                props_encoded = elems_props_encode_ahead(props_encoded)
+
+            # (nested elements iterator, header offset) of the elements being written
+            stack = [(iter(elem_root[3]), None)]
+            while stack:
+                elems_iter, elem_offset = stack[-1]
+                elem = next(elems_iter, None)
+                if elem is None:
+                    stack.pop()
+                    if elem_offset is not None:
+                        # close the nested list
+                        data += b'\0' * elem_head_size
+                        elem_end_write(elem_offset, data_offset + len(data))
+                    continue
+
+                elem_id, props, props_type, elems = elem
+                props_chunks = [chunk if type(chunk) is bytes else chunk.result()
+                                for chunk in next(props_encoded)]
+                props_length = sum(map(len, props_chunks))
+
+                # an empty nested list (the NUL record alone) for elements without properties,
+                # distinguishing 'P: {}' from 'P:' as the FBX SDK does
+                elem_sentinel = not elems and (not props or elem_id in _ELEMS_ID_ALWAYS_BLOCK_SENTINEL)
+
+                elem_offset = data_offset + len(data)
+                elem_end = elem_offset + elem_head_size + len(elem_id) + props_length
+                if elem_sentinel:
+                    elem_end += elem_head_size
+                # the end offset of elements with nested elements is written once known
+                data += elem_head.pack(0 if elems else elem_end, len(props), props_length, len(elem_id))
+                data += elem_id
+                for chunk in props_chunks:
+                    if len(chunk) >= _WRITE_BUFFER_SIZE:
+                        # large arrays are written directly
+                        data_flush()
+                        f.write(chunk)
+                        data_offset += len(chunk)
+                    else:
+                        data += chunk
+                del props_chunks
+
+                if elems:
+                    stack.append((iter(elems), elem_offset))
+                elif elem_sentinel:
+                    data += b'\0' * elem_head_size
+                if len(data) >= _WRITE_BUFFER_SIZE:
+                    data_flush()
+        finally:
+            if executor_owned is not None:
+                executor_owned.shutdown(wait=True)
+
+        # NULL record, ending the top-level list
+        data += b'\0' * elem_head_size
+
+        # footer, as written by the FBX SDK
+        data += _FOOT_ID
+        data += b'\0' * 4
+        # padding for alignment, a full 16 bytes when already aligned
+        pad = ((data_offset + len(data) + 15) & ~15) - (data_offset + len(data))
+        data += b'\0' * (pad or 16)
+        data += _struct_uint.pack(fbx_version)
+        data += b'\0' * 120
+        data += _FOOT_MAGIC
+        data_flush()
+
+
+def elems_props_encode_ahead(props_encoded):
+    """
+    Wrap the ``elems_props_encode`` generator, encoding elements ahead of the one returned,
+    so workers compress arrays while earlier elements are written.
+    """
+    from collections import deque
+
+    pending = deque()
+    pending_arrays = 0
+    for chunks in props_encoded:
+        chunks_arrays = sum(type(chunk) is not bytes for chunk in chunks)
+        pending.append((chunks, chunks_arrays))
+        pending_arrays += chunks_arrays
+        while pending and (len(pending) >= _ENCODE_AHEAD_ELEMS or pending_arrays >= _ENCODE_AHEAD_ARRAYS):
+            chunks, chunks_arrays = pending.popleft()
+            pending_arrays -= chunks_arrays
+            yield chunks
+    while pending:
+        yield pending.popleft()[0]